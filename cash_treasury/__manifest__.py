@@ -20,11 +20,17 @@ Cash Treasury module to manage Cash Out vouchers with:
         "security/ir.model.access.csv",
         "security/record_rules.xml",
         "data/sequence.xml",
+        "data/ir_cron.xml",
         "views/cash_out_view.xml",
 	"views/cash_in_view.xml",
 	"views/res_users_view.xml",
 	"views/cash_report_view.xml",
 	"views/cash_transaction_analysis_view.xml",
+	"views/cash_daily_summary_view.xml",
+	"views/cash_posting_job_view.xml",
+	"wizard/cash_report_wizard_view.xml",
+	"wizard/cash_analysis_export_wizard_view.xml",
+	"wizard/cash_treasury_bulk_result_view.xml",
 	"views/menu.xml",
     ],
     "application": True,
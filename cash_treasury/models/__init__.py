@@ -1,5 +1,16 @@
+from . import cash_voucher
 from . import cash_out
 from . import cash_in
 from . import res_users
+from . import cash_account
+from . import cash_balance_snapshot
+from . import cash_report_mixin
 from . import cash_report
-from . import cash_transaction_analysis
\ No newline at end of file
+from . import cash_transaction_analysis
+from . import cash_daily_summary
+from . import cash_posting_job
+from . import account_move
+from . import account_journal
+from . import account_account
+from . import ir_sequence
+from . import ir_rule
@@ -0,0 +1,11 @@
+from odoo import models
+
+
+class AccountAccount(models.Model):
+    _inherit = "account.account"
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "account_type" in vals:
+            self.env["cash.treasury.cash.account"]._refresh_scope()
+        return res
@@ -0,0 +1,166 @@
+import logging
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# journal fields the treasury cash account registry is derived from
+CASH_ACCOUNT_FIELDS = {"default_account_id", "company_id", "currency_id", "sequence"}
+
+# journal fields the allowed journals / accounts of the users depend on
+CASH_ACCESS_FIELDS = {"default_account_id", "company_id"}
+
+# numbering sequence of the cash vouchers of a journal, per voucher kind
+CASH_SEQUENCE_CODE = "cash.%s.%s"
+CASH_SEQUENCE_FIELD = "cash_%s_sequence_id"
+CASH_SEQUENCE_KINDS = ("in", "out")
+
+
+class AccountJournal(models.Model):
+    _inherit = "account.journal"
+
+    cash_in_sequence_id = fields.Many2one(
+        "ir.sequence", string="Cash In Sequence", readonly=True, copy=False,
+        help="Numbering of the cash in vouchers of this journal.",
+    )
+    cash_out_sequence_id = fields.Many2one(
+        "ir.sequence", string="Cash Out Sequence", readonly=True, copy=False,
+        help="Numbering of the cash out vouchers of this journal.",
+    )
+
+    # The treasury reports only cover default accounts of journals: moving a
+    # default account in or out of that set changes which lines are reported.
+    @api.model_create_multi
+    def create(self, vals_list):
+        journals = super().create(vals_list)
+        self.env["cash.treasury.cash.account"]._refresh_scope()
+        journals._cash_treasury_provision_sequences()
+        return journals
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "type" in vals:
+            self._cash_treasury_provision_sequences()
+        if CASH_ACCOUNT_FIELDS & vals.keys():
+            self.env["cash.treasury.cash.account"]._refresh_scope()
+        if CASH_ACCESS_FIELDS & vals.keys():
+            self._get_cash_treasury_users()._cash_treasury_invalidate_access()
+        return res
+
+    def unlink(self):
+        # registry rows of these journals go away with them (ondelete cascade)
+        accounts = self.default_account_id
+        users = self._get_cash_treasury_users()
+        res = super().unlink()
+        self.env["cash.treasury.cash.account"]._refresh_scope(accounts.ids)
+        users._cash_treasury_invalidate_access()
+        return res
+
+    def _get_cash_treasury_users(self):
+        return self.env["res.users"].sudo().with_context(active_test=False).search([
+            ("cash_treasury_journal_ids", "in", self.ids),
+        ])
+
+    # =================================================
+    # VOUCHER NUMBERING
+    # =================================================
+    # Each cash/bank journal has one sequence per voucher kind (code
+    # cash.in.<journal id> / cash.out.<journal id>), provisioned when the
+    # journal is created (or becomes a cash/bank journal) and when the module
+    # is installed, and referenced from the journal like its other sequences.
+    def init(self):
+        super().init()
+        # at most one sequence per journal and voucher kind, even when two
+        # transactions provision the same journal concurrently
+        self._cr.execute("""
+            SELECT 1 FROM pg_indexes
+            WHERE indexname = 'ir_sequence_cash_treasury_code_uniq'
+        """)
+        if self._cr.fetchone():
+            return
+        self._cr.execute("""
+            SELECT code FROM ir_sequence
+            WHERE code LIKE 'cash.in.%' OR code LIKE 'cash.out.%'
+            GROUP BY code HAVING COUNT(*) > 1
+        """)
+        duplicates = [code for code, in self._cr.fetchall()]
+        if duplicates:
+            _logger.warning(
+                "Cash voucher sequences %s are duplicated, not enforcing one sequence per journal.",
+                ", ".join(duplicates),
+            )
+            return
+        self._cr.execute("""
+            CREATE UNIQUE INDEX ir_sequence_cash_treasury_code_uniq
+                ON ir_sequence (code)
+                WHERE code LIKE 'cash.in.%' OR code LIKE 'cash.out.%'
+        """)
+
+    def _cash_treasury_sequence_values(self, kind):
+        self.ensure_one()
+        return {
+            "name": f"Cash {kind.capitalize()} {self.name}",
+            "code": CASH_SEQUENCE_CODE % (kind, self.id),
+            "prefix": (
+                f"{self.code}/IN/%(year)s-%(month)s/" if kind == "in"
+                else f"{self.code}/%(year)s-%(month)s/"
+            ),
+            "padding": 4,
+            "company_id": self.company_id.id,
+        }
+
+    @api.model
+    def _cash_treasury_provision_all(self):
+        """Provision the voucher sequences of every cash/bank journal."""
+        journals = self.sudo().with_context(active_test=False).search([("type", "in", ("cash", "bank"))])
+        journals._cash_treasury_provision_sequences()
+
+    def _cash_treasury_provision_sequences(self):
+        """Link the cash/bank journals ``self`` to their voucher sequences,
+        reusing the sequences created before they were referenced from the
+        journal and creating the missing ones."""
+        journals = self.sudo().filtered(
+            lambda j: j.type in ("cash", "bank")
+            and not all(j[CASH_SEQUENCE_FIELD % kind] for kind in CASH_SEQUENCE_KINDS)
+        )
+        if not journals:
+            return
+        Sequence = self.env["ir.sequence"].sudo()
+        todo = {
+            CASH_SEQUENCE_CODE % (kind, journal.id): (journal, kind)
+            for journal in journals
+            for kind in CASH_SEQUENCE_KINDS
+            if not journal[CASH_SEQUENCE_FIELD % kind]
+        }
+        sequences = {
+            sequence.code: sequence
+            for sequence in Sequence.search([("code", "in", list(todo))])
+        }
+        missing = [code for code in todo if code not in sequences]
+        created = Sequence.create([
+            todo[code][0]._cash_treasury_sequence_values(todo[code][1])
+            for code in missing
+        ])
+        sequences.update(zip(missing, created))
+        for code, (journal, kind) in todo.items():
+            journal[CASH_SEQUENCE_FIELD % kind] = sequences[code]
+
+    def _get_cash_treasury_sequence(self, kind):
+        """Return the voucher sequence of ``kind`` ("in" or "out") of the
+        journal ``self``, provisioning it if needed."""
+        self.ensure_one()
+        journal = self.sudo()
+        sequence = journal[CASH_SEQUENCE_FIELD % kind]
+        if not sequence:
+            # the sequence was deleted, or the journal predates provisioning:
+            # lock the journal so that concurrent postings wait for (and then
+            # retry after) the first one instead of creating it twice
+            self.env.flush_all()
+            self._cr.execute(
+                "SELECT id FROM account_journal WHERE id = %s FOR NO KEY UPDATE",
+                [self.id],
+            )
+            journal.invalidate_recordset([CASH_SEQUENCE_FIELD % kind])
+            journal._cash_treasury_provision_sequences()
+            sequence = journal[CASH_SEQUENCE_FIELD % kind]
+        return sequence
@@ -0,0 +1,17 @@
+from odoo import models
+
+
+class AccountMove(models.Model):
+    _inherit = "account.move"
+
+    def _post(self, soft=True):
+        posted = super()._post(soft=soft)
+        self.env["cash.treasury.report.line"]._sync_moves(posted)
+        self.env["cash.transaction.analysis"]._sync_moves(posted)
+        return posted
+
+    def button_draft(self):
+        res = super().button_draft()
+        self.env["cash.treasury.report.line"]._sync_moves(self)
+        self.env["cash.transaction.analysis"]._sync_moves(self)
+        return res
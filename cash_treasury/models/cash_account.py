@@ -0,0 +1,94 @@
+from odoo import models, fields
+
+
+class CashTreasuryCashAccount(models.Model):
+    """Registry of the accounts in scope of the treasury reports: cash/bank
+    accounts used as default account of a journal.
+
+    Kept in sync with journals and accounts so that report queries decide the
+    scope with a single indexed join instead of re-testing every line against
+    account_journal.
+    """
+    _name = "cash.treasury.cash.account"
+    _description = "Cash Treasury Cash Account"
+    _order = "account_id"
+
+    account_id = fields.Many2one("account.account", required=True, readonly=True, ondelete="cascade")
+    journal_id = fields.Many2one("account.journal", required=True, readonly=True, ondelete="cascade", index=True)
+    company_id = fields.Many2one("res.company", readonly=True)
+    currency_id = fields.Many2one("res.currency", readonly=True)
+
+    _sql_constraints = [
+        ("account_uniq", "unique(account_id)", "A cash account can only be registered once."),
+    ]
+
+    def init(self):
+        self._refresh()
+
+    def _refresh(self):
+        """Recompute the registry from the journals.
+
+        An account shared by several journals is registered once, with the
+        first journal (by sequence). Returns the ids of the accounts that
+        entered or left the scope.
+        """
+        self.env.flush_all()
+        self.env.cr.execute("""
+            WITH wanted AS (
+                SELECT DISTINCT ON (aj.default_account_id)
+                    aj.default_account_id AS account_id,
+                    aj.id AS journal_id,
+                    aj.company_id,
+                    COALESCE(aj.currency_id, rc.currency_id) AS currency_id
+                FROM account_journal aj
+                JOIN account_account acc ON acc.id = aj.default_account_id
+                JOIN res_company rc ON rc.id = aj.company_id
+                WHERE acc.account_type IN ('asset_cash', 'asset_bank')
+                ORDER BY aj.default_account_id, aj.sequence, aj.id
+            ),
+            removed AS (
+                DELETE FROM cash_treasury_cash_account ca
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM wanted WHERE wanted.account_id = ca.account_id
+                )
+                RETURNING ca.account_id
+            ),
+            upserted AS (
+                INSERT INTO cash_treasury_cash_account (
+                    account_id, journal_id, company_id, currency_id,
+                    create_uid, create_date, write_uid, write_date
+                )
+                SELECT
+                    wanted.account_id, wanted.journal_id, wanted.company_id, wanted.currency_id,
+                    %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+                FROM wanted
+                ON CONFLICT (account_id) DO UPDATE
+                SET journal_id = EXCLUDED.journal_id,
+                    company_id = EXCLUDED.company_id,
+                    currency_id = EXCLUDED.currency_id,
+                    write_uid = EXCLUDED.write_uid,
+                    write_date = EXCLUDED.write_date
+                WHERE (cash_treasury_cash_account.journal_id,
+                       cash_treasury_cash_account.company_id,
+                       cash_treasury_cash_account.currency_id)
+                      IS DISTINCT FROM
+                      (EXCLUDED.journal_id, EXCLUDED.company_id, EXCLUDED.currency_id)
+                RETURNING account_id, xmax = 0 AS inserted
+            )
+            SELECT account_id FROM removed
+            UNION ALL
+            SELECT account_id FROM upserted WHERE inserted
+        """, {'uid': self.env.uid})
+        changed = [account_id for account_id, in self.env.cr.fetchall()]
+        self.invalidate_model()
+        return changed
+
+    def _refresh_scope(self, account_ids=()):
+        """Refresh the registry and rebuild the report rows, counterpart
+        pairs, balance snapshots and daily summaries of the accounts that
+        entered or left the scope (plus ``account_ids``)."""
+        changed = list(set(self._refresh()) | set(account_ids))
+        self.env["cash.treasury.report.line"]._rebuild(changed)
+        self.env["cash.transaction.analysis"]._rebuild(changed)
+        self.env["cash.treasury.balance.snapshot"]._invalidate_accounts(changed)
+        self.env["cash.treasury.daily.summary"]._rebuild(changed)
@@ -0,0 +1,203 @@
+from odoo import models, fields, api
+from odoo.tools import SQL
+
+
+class CashTreasuryBalanceSnapshot(models.Model):
+    """Closing balance of a cash account at the end of a day or a month.
+
+    Built by a cron from the posted ledger and invalidated by backdated
+    postings, so that the balance at any date is the nearest snapshot plus
+    the lines posted after it, instead of the whole history of the account.
+
+    Closed months get a month snapshot; the days since the last month
+    snapshot get day snapshots, dropped once their month is closed.
+    """
+    _name = "cash.treasury.balance.snapshot"
+    _description = "Cash Treasury Balance Snapshot"
+    _order = "account_id, date desc"
+
+    company_id = fields.Many2one("res.company", readonly=True)
+    account_id = fields.Many2one("account.account", required=True, readonly=True, ondelete="cascade")
+    period = fields.Selection([
+        ("day", "Day"),
+        ("month", "Month"),
+    ], required=True, readonly=True)
+    date = fields.Date(required=True, readonly=True, help="Last day covered by the snapshot.")
+    balance = fields.Monetary(readonly=True)
+    currency_id = fields.Many2one("res.currency", readonly=True)
+
+    _sql_constraints = [
+        ("account_date_uniq", "unique(account_id, date, period)", "Only one snapshot per account, period and date."),
+    ]
+
+    def init(self):
+        # nearest snapshot lookups: latest snapshot of an account up to a date
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS cash_treasury_balance_snapshot_account_date_idx
+                ON cash_treasury_balance_snapshot (account_id, date DESC)
+        """)
+
+    # =================================================
+    # AS-OF BALANCES
+    # =================================================
+    @api.model
+    def _balance_at_query(self, date, account_ids=None):
+        """SQL returning (account_id, journal_id, currency_id, balance) of the
+        cash accounts with posted lines up to ``date`` (included): the
+        nearest snapshot plus the lines posted after it."""
+        account_filter = SQL("TRUE")
+        if account_ids:
+            account_filter = SQL("ca.account_id IN %s", tuple(account_ids))
+        return SQL("""
+            SELECT
+                ca.account_id,
+                ca.journal_id,
+                rc.currency_id,
+                COALESCE(snap.balance, 0) + COALESCE(delta.balance, 0) AS balance
+            FROM cash_treasury_cash_account ca
+            JOIN res_company rc ON rc.id = ca.company_id
+            LEFT JOIN LATERAL (
+                SELECT s.date, s.balance
+                FROM cash_treasury_balance_snapshot s
+                WHERE s.account_id = ca.account_id
+                  AND s.date <= %(date)s
+                ORDER BY s.date DESC
+                LIMIT 1
+            ) snap ON TRUE
+            LEFT JOIN LATERAL (
+                SELECT SUM(aml.debit - aml.credit) AS balance
+                FROM account_move_line aml
+                WHERE aml.account_id = ca.account_id
+                  AND aml.parent_state = 'posted'
+                  AND aml.date <= %(date)s
+                  AND (snap.date IS NULL OR aml.date > snap.date)
+            ) delta ON TRUE
+            WHERE %(account_filter)s
+              AND (snap.date IS NOT NULL OR delta.balance IS NOT NULL)
+        """, date=date, account_filter=account_filter)
+
+    @api.model
+    def get_balances_at(self, account_ids, date):
+        """Return {account_id: balance} of the cash ``account_ids`` at the end
+        of ``date``, in company currency.
+
+        The balances are read in SQL: outside of superuser mode, only the
+        accounts of the treasury journals of the user (as in the record
+        rules) are returned.
+        """
+        date = fields.Date.to_date(date)
+        self.check_access("read")
+        if not self.env.su:
+            allowed = set(self.env.user._cash_treasury_allowed_ids(self.env.companies.ids)[1])
+            account_ids = [account_id for account_id in account_ids if account_id in allowed]
+        balances = dict.fromkeys(account_ids, 0.0)
+        if not account_ids:
+            return balances
+        self.env.flush_all()
+        self.env.cr.execute(SQL(
+            "SELECT account_id, balance FROM (%s) b", self._balance_at_query(date, account_ids),
+        ))
+        balances.update(self.env.cr.fetchall())
+        return balances
+
+    # =================================================
+    # MAINTENANCE
+    # =================================================
+    @api.model
+    def _cron_build_snapshots(self):
+        """Add the missing snapshots of every cash account, starting from the
+        latest month snapshot of each account."""
+        self.env.flush_all()
+        # conflict with concurrent postings (which lock the same rows) rather
+        # than snapshot a ledger they are changing
+        self._cr.execute("""SELECT account_id FROM cash_treasury_cash_account""")
+        self.env['cash.treasury.report.line']._lock_accounts([r[0] for r in self._cr.fetchall()])
+        today = fields.Date.context_today(self)
+        month_start = today.replace(day=1)
+        params = {'uid': self.env.uid, 'today': today, 'month_start': month_start}
+        for period, bucket, until in (
+            ("month", "(date_trunc('month', aml.date) + interval '1 month - 1 day')::date", "%(month_start)s"),
+            ("day", "aml.date", "%(today)s"),
+        ):
+            self._cr.execute(f"""
+                WITH seed AS (
+                    SELECT ca.account_id, ca.company_id, rc.currency_id,
+                           last.date AS date, COALESCE(last.balance, 0) AS balance
+                    FROM cash_treasury_cash_account ca
+                    JOIN res_company rc ON rc.id = ca.company_id
+                    LEFT JOIN LATERAL (
+                        SELECT s.date, s.balance
+                        FROM cash_treasury_balance_snapshot s
+                        WHERE s.account_id = ca.account_id
+                          AND s.period = 'month'
+                        ORDER BY s.date DESC
+                        LIMIT 1
+                    ) last ON TRUE
+                ),
+                moves AS (
+                    SELECT seed.account_id, {bucket} AS date,
+                           SUM(aml.debit - aml.credit) AS amount
+                    FROM seed
+                    JOIN account_move_line aml ON aml.account_id = seed.account_id
+                    WHERE aml.parent_state = 'posted'
+                      AND aml.date < {until}
+                      AND (seed.date IS NULL OR aml.date > seed.date)
+                    GROUP BY seed.account_id, 2
+                )
+                INSERT INTO cash_treasury_balance_snapshot (
+                    company_id, account_id, period, date, balance, currency_id,
+                    create_uid, create_date, write_uid, write_date
+                )
+                SELECT
+                    seed.company_id, seed.account_id, '{period}', moves.date,
+                    seed.balance + SUM(moves.amount) OVER (
+                        PARTITION BY moves.account_id ORDER BY moves.date
+                    ),
+                    seed.currency_id,
+                    %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+                FROM moves
+                JOIN seed ON seed.account_id = moves.account_id
+                ON CONFLICT (account_id, date, period) DO UPDATE
+                SET balance = EXCLUDED.balance,
+                    write_uid = EXCLUDED.write_uid,
+                    write_date = EXCLUDED.write_date
+                WHERE cash_treasury_balance_snapshot.balance IS DISTINCT FROM EXCLUDED.balance
+            """, params)
+
+        # day snapshots of closed months are covered by the month snapshot
+        self._cr.execute("""
+            DELETE FROM cash_treasury_balance_snapshot d
+            USING cash_treasury_balance_snapshot m
+            WHERE d.period = 'day'
+              AND m.period = 'month'
+              AND m.account_id = d.account_id
+              AND m.date >= d.date
+        """)
+        self.invalidate_model()
+
+    @api.model
+    def _invalidate(self, starts):
+        """Drop the snapshots made stale by postings: ``starts`` maps account
+        ids to the earliest date touched on that account."""
+        if not starts:
+            return
+        account_ids = list(starts)
+        self._cr.execute("""
+            DELETE FROM cash_treasury_balance_snapshot s
+            USING unnest(%s::integer[], %s::date[]) AS t(account_id, date_from)
+            WHERE s.account_id = t.account_id
+              AND s.date >= t.date_from
+        """, [account_ids, [starts[a] for a in account_ids]])
+        self.invalidate_model()
+
+    @api.model
+    def _invalidate_accounts(self, account_ids):
+        """Drop every snapshot of ``account_ids`` (accounts leaving or
+        entering the treasury scope)."""
+        if not account_ids:
+            return
+        self._cr.execute("""
+            DELETE FROM cash_treasury_balance_snapshot
+            WHERE account_id IN %s
+        """, [tuple(account_ids)])
+        self.invalidate_model()
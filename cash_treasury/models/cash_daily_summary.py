@@ -0,0 +1,132 @@
+from odoo import models, fields, api
+from odoo.tools import SQL
+
+
+class CashTreasuryDailySummary(models.Model):
+    """Cash movements per company, journal, cash account and day.
+
+    Aggregated from the stored treasury report rows and refreshed only for
+    the (account, date) keys touched by postings, resets to draft and cash
+    in / cash out documents, so that month and year pivots read a handful of
+    rows per day instead of the move lines.
+    """
+    _name = "cash.treasury.daily.summary"
+    _description = "Cash Treasury Daily Summary"
+    _order = "date desc, account_id, journal_id"
+
+    company_id = fields.Many2one("res.company", string="Company", readonly=True)
+    journal_id = fields.Many2one("account.journal", string="Journal", readonly=True)
+    account_id = fields.Many2one("account.account", string="Account", readonly=True, ondelete="cascade")
+    date = fields.Date(string="Date", readonly=True)
+    debit = fields.Monetary(string="Debit", readonly=True)
+    credit = fields.Monetary(string="Credit", readonly=True)
+    net = fields.Monetary(string="Net", readonly=True)
+    move_count = fields.Integer(string="Entries", readonly=True)
+    cash_in_count = fields.Integer(string="Cash In Documents", readonly=True)
+    cash_out_count = fields.Integer(string="Cash Out Documents", readonly=True)
+    currency_id = fields.Many2one("res.currency", string="Currency", readonly=True)
+
+    _sql_constraints = [
+        ("key_uniq", "unique(account_id, date, journal_id)", "Only one summary per account, day and journal."),
+    ]
+
+    def init(self):
+        self._cr.execute("""SELECT 1 FROM cash_treasury_daily_summary LIMIT 1""")
+        if not self._cr.fetchone():
+            self._rebuild()
+
+    # =================================================
+    # REFRESH
+    # =================================================
+    @api.model
+    def _rebuild(self, account_ids=None):
+        """Recompute the summaries of ``account_ids`` (all when None)."""
+        if account_ids is None:
+            self._refresh_where(SQL("TRUE"), SQL("TRUE"))
+        elif account_ids:
+            self._refresh_where(
+                SQL("s.account_id IN %s", tuple(account_ids)),
+                SQL("l.account_id IN %s", tuple(account_ids)),
+            )
+
+    @api.model
+    def _refresh(self, keys):
+        """Recompute the summaries of the (account_id, date) ``keys``."""
+        keys = set(keys)
+        if not keys:
+            return
+        account_ids, dates = zip(*keys)
+        touched = SQL(
+            "unnest(%s::integer[], %s::date[]) AS t(account_id, date)",
+            list(account_ids), list(dates),
+        )
+        self._refresh_where(
+            SQL("(s.account_id, s.date) IN (SELECT t.account_id, t.date FROM %s)", touched),
+            SQL("(l.account_id, l.date) IN (SELECT t.account_id, t.date FROM %s)", touched),
+        )
+
+    @api.model
+    def _refresh_moves(self, moves):
+        """Recompute the summaries of the days where ``moves`` hit a cash
+        account (after their documents were linked or unlinked)."""
+        if not moves:
+            return
+        self.env.flush_all()
+        self._cr.execute("""
+            SELECT DISTINCT account_id, date
+            FROM cash_treasury_report_line
+            WHERE move_id IN %s
+        """, [tuple(moves.ids)])
+        self._refresh(self._cr.fetchall())
+
+    def _refresh_where(self, summary_filter, line_filter):
+        self.env.flush_all()
+        self._cr.execute(SQL(
+            "DELETE FROM cash_treasury_daily_summary s WHERE %s", summary_filter,
+        ))
+        self._cr.execute(SQL("""
+            WITH per_move AS (
+                SELECT
+                    l.account_id,
+                    l.journal_id,
+                    l.date,
+                    l.move_id,
+                    SUM(l.debit) AS debit,
+                    SUM(l.credit) AS credit,
+                    MAX(l.currency_id) AS currency_id
+                FROM cash_treasury_report_line l
+                WHERE %(line_filter)s
+                GROUP BY l.account_id, l.journal_id, l.date, l.move_id
+            )
+            INSERT INTO cash_treasury_daily_summary (
+                company_id, journal_id, account_id, date,
+                debit, credit, net, move_count, cash_in_count, cash_out_count,
+                currency_id, create_uid, create_date, write_uid, write_date
+            )
+            SELECT
+                ca.company_id,
+                m.journal_id,
+                m.account_id,
+                m.date,
+                SUM(m.debit),
+                SUM(m.credit),
+                SUM(m.debit - m.credit),
+                COUNT(*),
+                SUM(docs.cash_in),
+                SUM(docs.cash_out),
+                MAX(m.currency_id),
+                %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+            FROM per_move m
+            JOIN cash_treasury_cash_account ca ON ca.account_id = m.account_id
+            CROSS JOIN LATERAL (
+                SELECT
+                    (SELECT COUNT(*) FROM cash_treasury_in ci
+                     WHERE ci.journal_entry_id = m.move_id
+                        OR ci.reversal_entry_id = m.move_id) AS cash_in,
+                    (SELECT COUNT(*) FROM cash_treasury_out co
+                     WHERE co.journal_entry_id = m.move_id
+                        OR co.reversal_entry_id = m.move_id) AS cash_out
+            ) docs
+            GROUP BY ca.company_id, m.journal_id, m.account_id, m.date
+        """, line_filter=line_filter, uid=self.env.uid))
+        self.invalidate_model()
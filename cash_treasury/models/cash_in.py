@@ -39,9 +39,20 @@ class CashTreasuryInMultiAccountLine(models.Model):
 class CashTreasuryIn(models.Model):
     _name = "cash.treasury.in"
     _description = "Cash In"
-    _inherit = ["mail.thread", "mail.activity.mixin"]
+    _inherit = ["mail.thread", "mail.activity.mixin", "cash.treasury.voucher.mixin"]
     _order = "id desc"
 
+    _voucher_date_field = "collection_date"
+    _voucher_done_state = "posted"
+    _voucher_sequence_kind = "in"
+    _voucher_party_type_field = "receive_from_type"
+    _voucher_loaded_field = "invoices_loaded"
+    _voucher_allocation_amount_field = "amount_to_collect"
+    _voucher_invoice_type = "out_invoice"
+    _voucher_payment_type = "inbound"
+    _voucher_partner_account_field = "property_account_receivable_id"
+    _voucher_counterpart_sign = -1
+
     name = fields.Char(readonly=True, copy=False)
 
     state = fields.Selection(
@@ -151,8 +162,8 @@ class CashTreasuryIn(models.Model):
         currency_field="currency_id",
     )
 
-    journal_entry_id = fields.Many2one("account.move", readonly=True)
-    reversal_entry_id = fields.Many2one("account.move", readonly=True, copy=False)
+    journal_entry_id = fields.Many2one("account.move", readonly=True, index="btree_not_null")
+    reversal_entry_id = fields.Many2one("account.move", readonly=True, copy=False, index="btree_not_null")
 
     # =================================================
     # DOMAIN METHOD FOR JOURNAL FILTERING
@@ -164,7 +175,7 @@ class CashTreasuryIn(models.Model):
             if user.has_group('base.group_system'):
                 return [('type', 'in', ('cash', 'bank'))]
             
-            journal_ids = user.cash_treasury_journal_ids.ids
+            journal_ids = user._cash_treasury_allowed_ids(self.env.companies.ids)[0]
             
             if not journal_ids:
                 return [('id', '=', False)]
@@ -185,7 +196,7 @@ class CashTreasuryIn(models.Model):
             return
         
         if self.journal_id and self.env.user.id:
-            user_journals = self.env.user.cash_treasury_journal_ids.ids
+            user_journals = self.env.user._cash_treasury_allowed_ids(self.env.companies.ids)[0]
             if self.journal_id.id not in user_journals:
                 warning = {
                     'title': 'Permission Denied',
@@ -198,23 +209,21 @@ class CashTreasuryIn(models.Model):
     # HARD LOCK
     # =================================================
     def write(self, vals):
-        if (
-            self.env.user.has_group("cash_treasury.group_cash_in_accountant")
-            and set(vals.keys()).issubset({"state", "collection_date"})
-        ):
-            return super().write(vals)  
-
-        if self.env.user.has_group("cash_treasury.group_cash_in_accountant"):
-            allowed = {
-                "state",
-                "journal_entry_id",
-                "reversal_entry_id",
-                "name",
-                "collection_date",
-            }
-            if set(vals.keys()).issubset(allowed):
-                return super().write(vals)
-            
+        # group memberships are resolved once per call and the states of the
+        # records read with one grouped query, whatever the size of self
+        keys = set(vals)
+        user = self.env.user
+
+        accountant_allowed = {
+            "state",
+            "journal_entry_id",
+            "reversal_entry_id",
+            "name",
+            "collection_date",
+        }
+        if keys.issubset(accountant_allowed) and user.has_group("cash_treasury.group_cash_in_accountant"):
+            return super().write(vals)
+
         allowed_with_state = {
             "state",
             "collection_date",
@@ -235,21 +244,14 @@ class CashTreasuryIn(models.Model):
             "message_follower_ids",
         }
 
-        for rec in self:
-            if rec.state == "approved":
-                if (
-                    self.env.user.has_group("cash_treasury.group_cash_in_entry")
-                    and set(vals.keys()) == {"collection_date"}
-                ):
-                    continue
-
-            if rec.state != "draft":
-                if "state" in vals:
-                    if not set(vals.keys()).issubset(allowed_with_state):
-                        raise UserError("Modification is only allowed in Draft state.")
-                else:
-                    if not set(vals.keys()).issubset(allowed_no_state):
-                        raise UserError("Modification is only allowed in Draft state.")
+        allowed = allowed_with_state if "state" in vals else allowed_no_state
+        if not keys.issubset(allowed):
+            editable_states = {"draft"}
+            # Cash Entry sets the Collection Date of approved documents
+            if keys == {"collection_date"} and user.has_group("cash_treasury.group_cash_in_entry"):
+                editable_states.add("approved")
+            if self._read_states() - editable_states:
+                raise UserError("Modification is only allowed in Draft state.")
 
         return super().write(vals)
 
@@ -375,16 +377,18 @@ class CashTreasuryIn(models.Model):
     # =================================================
     # CREATE METHOD
     # =================================================
-    @api.model
-    def create(self, vals):
-        if 'journal_id' not in vals:
-            user_journals = self.env.user.cash_treasury_journal_ids
-            if len(user_journals) == 1:
-                vals['journal_id'] = user_journals[0].id
-            elif len(user_journals) == 0:
+    @api.model_create_multi
+    def create(self, vals_list):
+        if any('journal_id' not in vals for vals in vals_list):
+            # resolved once for the whole batch
+            user_journals = self.env.user._cash_treasury_allowed_ids(self.env.companies.ids)[0]
+            if not user_journals:
                 raise UserError("You don't have permission to use any cash journal. Please contact administrator.")
-        
-        return super(CashTreasuryIn, self).create(vals)
+            if len(user_journals) == 1:
+                for vals in vals_list:
+                    vals.setdefault('journal_id', user_journals[0])
+
+        return super(CashTreasuryIn, self).create(vals_list)
 
     # =================================================
     # BUTTON: LOAD CUSTOMER INVOICES
@@ -507,226 +511,7 @@ class CashTreasuryIn(models.Model):
     # POST (CREATE ENTRY + RECONCILE) - MATCHING CASH_OUT
     # =================================================
     def action_post(self):
-        for rec in self:
-            if rec.state != "approved":
-                raise UserError("Only approved records can be posted.")
-            if not rec.collection_date:
-                raise UserError("Please set the Collection Date before posting.")
-
-            # ---------- SEQUENCE (on posting) ----------
-            Sequence = self.env["ir.sequence"].sudo()
-            seq_code = f"cash.in.{rec.journal_id.id}"
-            sequence = Sequence.search([("code", "=", seq_code)], limit=1)
-            if not sequence:
-                sequence = Sequence.create(
-                    {
-                        "name": f"Cash In {rec.journal_id.name}",
-                        "code": seq_code,
-                        "prefix": f"{rec.journal_id.code}/IN/%(year)s-%(month)s/",
-                        "padding": 4,
-                        "company_id": rec.company_id.id,
-                    }
-                )
-
-            seq_name = sequence.with_context(ir_sequence_date=rec.collection_date).next_by_id()
-
-            debit_account = rec.journal_id.default_account_id
-            if not debit_account:
-                raise UserError("Journal has no default account.")
-
-            lines = []
-
-            # ====== CURRENCY FIX (Journal Currency) ======
-            journal_currency = rec.journal_id.currency_id or rec.company_id.currency_id
-            company_currency = rec.company_id.currency_id
-
-            def _to_company(amount_foreign):
-                return journal_currency._convert(
-                    amount_foreign,
-                    company_currency,
-                    rec.company_id,
-                    rec.collection_date
-                )
-
-            def _cur_vals(amount_foreign):
-                if journal_currency == company_currency:
-                    return {}
-                return {
-                    "currency_id": journal_currency.id,
-                    "amount_currency": amount_foreign,
-                }
-            # ===========================================
-
-            # =====================================================
-            # ? MULTI ACCOUNT MODE (NO PARTNER)
-            # =====================================================
-            if rec.multi_account:
-                if rec.invoices_loaded:
-                    raise UserError("Multi Account cannot be used with Customer Invoices allocation.")
-
-                if not rec.multi_account_line_ids:
-                    raise UserError("Please add Multi Account lines first.")
-
-                total = 0.0
-                for l in rec.multi_account_line_ids:
-                    if not l.account_id:
-                        raise UserError("Each Multi Account line must have an Account.")
-                    if not l.amount or l.amount <= 0:
-                        raise UserError("Each Multi Account line Amount must be greater than zero.")
-
-                    total += l.amount
-
-                    lines.append(
-                        (0, 0, {
-                            "account_id": l.account_id.id,
-                            "partner_id": False,   # ? NO PARTNER
-                            "credit": _to_company(l.amount),
-                            "debit": 0.0,
-                            "name": seq_name,
-                            **_cur_vals(-l.amount),
-                        })
-                    )
-
-                # Debit line (Cash/Bank)
-                lines.append(
-                    (0, 0, {
-                        "account_id": debit_account.id,
-                        "debit": _to_company(total),
-                        "credit": 0.0,
-                        "name": seq_name,
-                        **_cur_vals(total),
-                    })
-                )
-
-            # =====================================================
-            # ? NORMAL MODE (ACCOUNT/PARTNER)
-            # =====================================================
-            else:
-                credit_account = (
-                    rec.partner_id.property_account_receivable_id
-                    if rec.receive_from_type == "partner"
-                    else rec.account_id
-                )
-                if not credit_account:
-                    raise UserError("Missing source account.")
-
-                # ---------- DEBIT LINE (Cash/Bank) ----------
-                lines.append(
-                    (0, 0, {
-                        "account_id": debit_account.id,
-                        "debit": _to_company(rec.amount),
-                        "credit": 0.0,
-                        "name": seq_name,
-                        **_cur_vals(rec.amount),
-                    })
-                )
-
-                # ---------- WITH INVOICES ----------
-                if rec.invoices_loaded:
-                    allocations = rec.allocation_line_ids.filtered(
-                        lambda l: l.selected and l.amount_to_collect > 0
-                    )
-                    if not allocations:
-                        raise UserError("Please select invoices and enter amounts.")
-
-                    total = sum(al.amount_to_collect for al in allocations)
-
-                    if float_compare(
-                        total,
-                        rec.amount or 0.0,
-                        precision_rounding=rec.currency_id.rounding,
-                    ) != 0:
-                        raise UserError("Allocated total must equal Cash In amount.")
-
-                    for al in allocations:
-                        lines.append(
-                            (0, 0, {
-                                "account_id": credit_account.id,
-                                "partner_id": rec.partner_id.id,
-                                "credit": _to_company(al.amount_to_collect),
-                                "debit": 0.0,
-                                "name": seq_name,
-                                **_cur_vals(-al.amount_to_collect),
-                            })
-                        )
-
-                # ---------- WITHOUT INVOICES ----------
-                else:
-                    lines.append(
-                        (0, 0, {
-                            "account_id": credit_account.id,
-                            "partner_id": rec.partner_id.id if rec.receive_from_type == "partner" else False,
-                            "credit": _to_company(rec.amount),
-                            "debit": 0.0,
-                            "name": seq_name,
-                            **_cur_vals(-rec.amount),
-                        })
-                    )
-
-            move = self.env["account.move"].create(
-                {
-                    "move_type": "entry",
-                    "journal_id": rec.journal_id.id,
-                    "date": rec.collection_date,
-                    "ref": seq_name,
-                    "line_ids": lines,
-                }
-            )
-            move.action_post()
-
-            # =====================================================
-            # RECONCILE (ONLY FOR CUSTOMER INVOICES)
-            # =====================================================
-            if rec.invoices_loaded and not rec.multi_account:
-                credit_account = rec.partner_id.property_account_receivable_id
-
-                allocations = rec.allocation_line_ids.filtered(
-                    lambda l: l.selected and (l.amount_to_collect or 0.0) > 0
-                )
-
-                
-                pay_lines_dict = {}
-                for pay_line in move.line_ids.filtered(
-                    lambda l: l.account_id.id == credit_account.id
-                    and not l.reconciled
-                    and l.account_id.reconcile
-                    and l.partner_id.id == rec.partner_id.id
-                ):
-                    # !!! CHANGED: credit instead of debit (    )
-                    amount_key = pay_line.credit
-                    pay_lines_dict.setdefault(amount_key, []).append(pay_line)
-
-                
-                for al in allocations:
-                    inv_lines = al.invoice_id.line_ids.filtered(
-                        lambda l: l.account_id.id == credit_account.id
-                        and not l.reconciled
-                        and l.account_id.reconcile
-                    )
-
-                    if not inv_lines:
-                        continue
-
-                    pay_amount = al.amount_to_collect
-                    
-                    if pay_amount in pay_lines_dict and pay_lines_dict[pay_amount]:
-                        pay_line = pay_lines_dict[pay_amount].pop(0)
-                        (inv_lines + pay_line).reconcile()
-                        
-                        if not pay_lines_dict[pay_amount]:
-                            del pay_lines_dict[pay_amount]
-                    else:
-                        raise UserError(
-                            f"No matching receipt line found for invoice {al.invoice_id.name} "
-                            f"with amount {pay_amount}"
-                        )
-
-            rec.write({
-                "name": seq_name,
-                "journal_entry_id": move.id,
-                "state": "posted",
-            })
-
+        self._post_vouchers()
 
     # =================================================
     # SUPER APPROVER: CANCEL POSTED -> DRAFT
@@ -739,89 +524,10 @@ class CashTreasuryIn(models.Model):
         if not_posted:
             raise UserError("All selected Cash In records must be in Posted state.")
 
-        today = fields.Date.context_today(self)
-
-        for rec in self:
-            move = rec.journal_entry_id
-            if not move:
-                raise UserError("No journal entry found on this document.")
-
-            # 1) Unreconcile move lines
-            for line in move.line_ids:
-                if line.reconciled:
-                    line.remove_move_reconcile()
-
-            # 2) Create reversal move
-            rev_lines = []
-            for line in move.line_ids:
-                vals = {
-                    "account_id": line.account_id.id,
-                    "partner_id": line.partner_id.id if line.partner_id else False,
-                    "debit": line.credit,
-                    "credit": line.debit,
-                    "name": f"Reversal of {move.name or move.ref or rec.name}",
-                }
-                if line.currency_id:
-                    vals["currency_id"] = line.currency_id.id
-                    vals["amount_currency"] = -line.amount_currency
-                rev_lines.append((0, 0, vals))
-
-            rev_move = self.env["account.move"].create(
-                {
-                    "move_type": "entry",
-                    "journal_id": move.journal_id.id,
-                    "date": today,
-                    "ref": f"Reversal of {move.ref or move.name or rec.name}",
-                    "line_ids": rev_lines,
-                }
-            )
-            rev_move.action_post()
-
-            rec.reversal_entry_id = rev_move.id
+        self._cancel_vouchers()
+        return True
 
-            # 3) Auto-reconcile original move with reversal move
-            # This prevents the original move from being reconciled again
-            
-            move_lines = move.line_ids.filtered(lambda l: not l.reconciled and l.account_id.reconcile)
-            rev_lines_list = rev_move.line_ids.filtered(lambda l: not l.reconciled and l.account_id.reconcile)
-            
-            lines_by_key = {}
-            for line in move_lines:
-                key = (line.account_id.id, line.partner_id.id or False)
-                lines_by_key.setdefault(key, []).append(('original', line))
-            
-            for line in rev_lines_list:
-                key = (line.account_id.id, line.partner_id.id or False)
-                lines_by_key.setdefault(key, []).append(('reversal', line))
-            
-            # Reconcile matching lines
-            for key, lines in lines_by_key.items():
-                if len(lines) >= 2:
-                    original_lines = [l for t, l in lines if t == 'original']
-                    reversal_lines = [l for t, l in lines if t == 'reversal']
-                    
-                    if original_lines and reversal_lines:
-                        for o_line in original_lines:
-                            for r_line in reversal_lines:
-                                if not o_line.reconciled and not r_line.reconciled:
-                                    if abs(o_line.balance + r_line.balance) < 0.01:
-                                        try:
-                                            (o_line + r_line).reconcile()
-                                        except Exception:
-                                            pass
-
-            # 4) Return to draft
-            rec.write(
-                {
-                    "state": "draft",
-                    "journal_entry_id": False,
-                    "name": False,
-                    "collection_date": False,
-                }
-            )
 
-        return True
-            
 # =====================================================
 # ALLOCATION LINE
 # =====================================================
@@ -852,6 +558,9 @@ class CashTreasuryInAllocation(models.Model):
 
     amount_to_collect = fields.Monetary(currency_field="currency_id")
 
+    # counterpart line of the voucher entry generated for this allocation
+    move_line_id = fields.Many2one("account.move.line", readonly=True, copy=False)
+
     currency_id = fields.Many2one(
         "res.currency",
         related="cash_in_id.currency_id",
@@ -0,0 +1,321 @@
+import logging
+import queue
+import threading
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import SQL
+
+from .cash_voucher import CONCURRENCY_ERRORS
+
+_logger = logging.getLogger(__name__)
+
+# documents posted per transaction by the cron worker
+POSTING_CHUNK_SIZE = 50
+# parallel workers (one cash account at a time each), unless set by the
+# cash_treasury.posting_workers system parameter
+POSTING_WORKERS = 4
+
+VOUCHER_MODELS = [
+    ("cash.treasury.out", "Cash Out"),
+    ("cash.treasury.in", "Cash In"),
+]
+
+
+class CashTreasuryPostingJob(models.Model):
+    """Approved vouchers of one journal posted in the background.
+
+    Jobs are processed by a cron in chunks of POSTING_CHUNK_SIZE documents,
+    each chunk committed on its own, so that a large selection neither runs
+    inside one HTTP request nor is lost as a whole when a document fails.
+    Documents are posted as the user who queued them.
+
+    Postings serialize on the cash account they move (see
+    cash.treasury.report.line._lock_accounts), and several journals may
+    share one, so the jobs are processed in parallel per cash account by a
+    pool of workers, each with its own cursor; the jobs of the journals of
+    one cash account stay with one worker.
+    """
+    _name = "cash.treasury.posting.job"
+    _description = "Cash Treasury Posting Job"
+    _order = "id desc"
+
+    name = fields.Char(string="Job", required=True, readonly=True)
+    res_model = fields.Selection(VOUCHER_MODELS, string="Documents", required=True, readonly=True)
+    journal_id = fields.Many2one("account.journal", string="Journal", required=True, readonly=True)
+    company_id = fields.Many2one(related="journal_id.company_id", store=True)
+    user_id = fields.Many2one(
+        "res.users", string="Requested By", required=True, readonly=True,
+        default=lambda self: self.env.user,
+    )
+    state = fields.Selection([
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Done with Failures"),
+    ], string="Status", required=True, readonly=True, default="queued")
+    date_start = fields.Datetime(string="Started", readonly=True)
+    date_end = fields.Datetime(string="Finished", readonly=True)
+    line_ids = fields.One2many("cash.treasury.posting.job.line", "job_id", string="Documents", readonly=True)
+
+    total_count = fields.Integer(string="Total", compute="_compute_counts")
+    posted_count = fields.Integer(string="Posted", compute="_compute_counts")
+    failed_count = fields.Integer(string="Failed", compute="_compute_counts")
+    progress = fields.Float(string="Progress", compute="_compute_counts")
+
+    @api.depends("line_ids.state")
+    def _compute_counts(self):
+        counts = {
+            (job.id, state): count
+            for job, state, count in self.env["cash.treasury.posting.job.line"]._read_group(
+                [("job_id", "in", self.ids)], ["job_id", "state"], ["__count"],
+            )
+        }
+        for job in self:
+            pending = counts.get((job.id, "pending"), 0)
+            job.posted_count = counts.get((job.id, "posted"), 0)
+            job.failed_count = counts.get((job.id, "failed"), 0)
+            job.total_count = pending + job.posted_count + job.failed_count
+            job.progress = (
+                100.0 * (job.total_count - pending) / job.total_count
+                if job.total_count else 0.0
+            )
+
+    # =================================================
+    # QUEUE
+    # =================================================
+    @api.model
+    def _enqueue(self, vouchers):
+        """Queue the approved ``vouchers``, one job per journal, and wake the
+        worker up. Returns the jobs."""
+        not_approved = vouchers.filtered(lambda r: r.state != "approved")
+        if not_approved:
+            raise UserError(_(
+                "Only approved documents can be posted:\n%s",
+                "\n".join(not_approved.mapped("display_name")),
+            ))
+        vouchers.check_access("write")
+
+        queued = self.env["cash.treasury.posting.job.line"].sudo().search([
+            ("res_model", "=", vouchers._name),
+            ("res_id", "in", vouchers.ids),
+            ("state", "=", "pending"),
+        ])
+        if queued:
+            raise UserError(_(
+                "These documents are already waiting in a posting job:\n%s",
+                "\n".join(queued.mapped("document")),
+            ))
+
+        jobs = self.sudo().create([
+            {
+                "name": _("%(type)s - %(journal)s (%(count)s documents)",
+                          type=dict(VOUCHER_MODELS)[vouchers._name],
+                          journal=journal.display_name,
+                          count=len(records)),
+                "res_model": vouchers._name,
+                "journal_id": journal.id,
+                "user_id": self.env.uid,
+                "line_ids": [
+                    (0, 0, {"res_id": rec.id, "document": rec.display_name})
+                    for rec in records
+                ],
+            }
+            for journal, records in vouchers.grouped("journal_id").items()
+        ])
+        self.env.ref("cash_treasury.ir_cron_cash_treasury_posting_job")._trigger()
+        return jobs.sudo(False)
+
+    def _get_action(self):
+        action = {
+            "type": "ir.actions.act_window",
+            "name": _("Posting Jobs"),
+            "res_model": self._name,
+            "views": [(False, "list"), (False, "form")],
+            "domain": [("id", "in", self.ids)],
+        }
+        if len(self) == 1:
+            action.update(views=[(False, "form")], res_id=self.id)
+        return action
+
+    # =================================================
+    # WORKER
+    # =================================================
+    @api.model
+    def _cron_process_jobs(self):
+        """Post the pending documents of the queued jobs, committing after
+        every chunk. Whatever is left when the cron is stopped is resumed at
+        its next run."""
+        jobs = self.search([("state", "in", ("queued", "running"))], order="id")
+        remaining = self.env["cash.treasury.posting.job.line"].search_count([
+            ("job_id", "in", jobs.ids), ("state", "=", "pending"),
+        ])
+        groups = [
+            group.ids
+            for group in jobs.grouped(lambda job: job.journal_id.default_account_id).values()
+        ]
+        workers = min(self._get_worker_count(), len(groups))
+        if workers <= 1 or getattr(threading.current_thread(), "testing", False):
+            done = sum(self.browse(ids)._process_jobs() for ids in groups)
+        else:
+            done = self._run_workers(groups, workers)
+        self.env["ir.cron"]._notify_progress(done=done, remaining=remaining - done)
+
+    @api.model
+    def _get_worker_count(self):
+        value = self.env["ir.config_parameter"].sudo().get_param("cash_treasury.posting_workers")
+        try:
+            return max(int(value), 1) if value else POSTING_WORKERS
+        except ValueError:
+            _logger.warning("Invalid cash_treasury.posting_workers value: %r", value)
+            return POSTING_WORKERS
+
+    @api.model
+    def _run_workers(self, groups, workers):
+        """Process the job ``groups`` (lists of job ids of one cash account) with
+        ``workers`` threads, each with its own cursor. Returns the number of
+        documents processed."""
+        todo = queue.SimpleQueue()
+        for ids in groups:
+            todo.put(ids)
+        registry, uid, context = self.env.registry, self.env.uid, dict(self.env.context)
+        dbname = self.env.cr.dbname
+        done = []
+
+        def work():
+            threading.current_thread().dbname = dbname
+            threading.current_thread().uid = uid
+            while True:
+                try:
+                    ids = todo.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    with registry.cursor() as cr:
+                        env = api.Environment(cr, uid, context)
+                        done.append(env[self._name].browse(ids)._process_jobs())
+                except Exception:
+                    _logger.exception("Posting jobs %s failed", ids)
+
+        threads = [
+            threading.Thread(target=work, name=f"cash_treasury.posting.{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(done)
+
+    def _process_jobs(self):
+        """Post the pending documents of the jobs ``self``, by chunks, each
+        committed on its own. Returns the number of documents processed."""
+        Line = self.env["cash.treasury.posting.job.line"]
+        done = 0
+        for job in self:
+            if job.state == "queued":
+                job.write({"state": "running", "date_start": fields.Datetime.now()})
+            job._fail_deleted_documents()
+            self._commit()
+            while True:
+                lines = job._claim_lines(POSTING_CHUNK_SIZE)
+                if not lines:
+                    break
+                try:
+                    job._process_lines(lines)
+                except CONCURRENCY_ERRORS:
+                    # the snapshot of the transaction is stale: retrying the
+                    # documents in it would fail again, leave them pending
+                    if getattr(threading.current_thread(), "testing", False):
+                        raise
+                    self.env.cr.rollback()
+                    _logger.info("Posting job %s conflicted with a concurrent update, resuming at the next run", job.id)
+                    break
+                done += len(lines)
+                self._commit()
+            # documents locked by another transaction are left for a next run
+            if not Line.search_count([("job_id", "=", job.id), ("state", "=", "pending")]):
+                job.write({
+                    "state": "failed" if job.failed_count else "done",
+                    "date_end": fields.Datetime.now(),
+                })
+                self._commit()
+        return done
+
+    def _claim_lines(self, limit):
+        """Lock and return up to ``limit`` pending lines of the job, skipping
+        those whose line or document is locked by another worker."""
+        self.ensure_one()
+        self.env.flush_all()
+        self.env.cr.execute(SQL("""
+            SELECT l.id
+            FROM cash_treasury_posting_job_line l
+            JOIN %(voucher)s v ON v.id = l.res_id
+            WHERE l.job_id = %(job_id)s
+              AND l.state = 'pending'
+            ORDER BY l.id
+            LIMIT %(limit)s
+            FOR UPDATE OF l, v SKIP LOCKED
+        """, voucher=SQL.identifier(self.env[self.res_model]._table), job_id=self.id, limit=limit))
+        return self.env["cash.treasury.posting.job.line"].browse(r[0] for r in self.env.cr.fetchall())
+
+    def _fail_deleted_documents(self):
+        self.ensure_one()
+        pending = self.line_ids.filtered(lambda l: l.state == "pending")
+        existing = set(self.env[self.res_model].browse(pending.mapped("res_id")).exists().ids)
+        pending.filtered(lambda l: l.res_id not in existing).write({
+            "state": "failed",
+            "error": _("The document was deleted."),
+        })
+
+    def _process_lines(self, lines):
+        """Post the documents of ``lines`` in one batch, or one by one when
+        the batch fails, and record the outcome of each document."""
+        self.ensure_one()
+        vouchers = (
+            self.env[self.res_model]
+            .with_user(self.user_id)
+            .with_company(self.company_id)
+            .browse(lines.mapped("res_id"))
+        )
+        line_of = {line.res_id: line for line in lines}
+
+        failures = dict(vouchers._run_isolated("_post_vouchers", chunk_size=len(vouchers) or 1))
+        for voucher in vouchers:
+            if voucher in failures:
+                line_of[voucher.id].write({"state": "failed", "error": failures[voucher]})
+            else:
+                line_of[voucher.id].write({"state": "posted", "move_id": voucher.journal_entry_id.id})
+
+    @api.model
+    def _commit(self):
+        # tests run in a single transaction
+        if not getattr(threading.current_thread(), "testing", False):
+            self.env.cr.commit()
+
+
+class CashTreasuryPostingJobLine(models.Model):
+    _name = "cash.treasury.posting.job.line"
+    _description = "Cash Treasury Posting Job Document"
+    _order = "job_id, id"
+
+    job_id = fields.Many2one("cash.treasury.posting.job", required=True, readonly=True, index=True, ondelete="cascade")
+    res_model = fields.Selection(related="job_id.res_model", store=True)
+    res_id = fields.Integer(string="Document ID", required=True, readonly=True, index=True)
+    document = fields.Char(string="Document", readonly=True)
+    state = fields.Selection([
+        ("pending", "Pending"),
+        ("posted", "Posted"),
+        ("failed", "Failed"),
+    ], string="Status", required=True, readonly=True, default="pending", index=True)
+    move_id = fields.Many2one("account.move", string="Journal Entry", readonly=True)
+    error = fields.Text(string="Error", readonly=True)
+
+    def action_open_document(self):
+        self.ensure_one()
+        return {
+            "type": "ir.actions.act_window",
+            "res_model": self.res_model,
+            "res_id": self.res_id,
+            "views": [(False, "form")],
+        }
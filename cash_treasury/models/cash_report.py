@@ -1,10 +1,22 @@
-from odoo import models, fields, api
+from odoo import models, fields, _
+from odoo.tools import SQL
+from odoo.tools.sql import column_exists, create_index
+
+# Posted lines of the treasury cash accounts: every query joins
+# cash_treasury_cash_account (ca) on aml.account_id to restrict the scope.
+# Filtering on aml.parent_state (rather than am.state) lets the planner use the
+# partial ledger index created in init().
+CASH_LINES_SCOPE = """
+    aml.parent_state = 'posted'
+"""
+
 
 class CashTreasuryReportLine(models.Model):
     _name = 'cash.treasury.report.line'
+    _inherit = 'cash.treasury.balance.mixin'
     _description = 'Cash Treasury Report Line'
     _auto = False
-    _order = 'date'
+    _order = 'date, id'
 
     name = fields.Char(string="Reference")
     date = fields.Date(string="Date")
@@ -12,15 +24,41 @@ class CashTreasuryReportLine(models.Model):
     account_id = fields.Many2one('account.account', string="Account")
     move_id = fields.Many2one('account.move', string="Journal Entry")
     move_type = fields.Char(string="Type")
-    debit = fields.Float(string="Debit")
-    credit = fields.Float(string="Credit")
-    balance_str = fields.Char(string="Balance After Move")
+    debit = fields.Monetary(string="Debit")
+    credit = fields.Monetary(string="Credit")
+    balance = fields.Monetary(string="Balance After Move")
+    currency_id = fields.Many2one('res.currency', string="Currency")
 
-    def init(self):
-        self._cr.execute("""DROP VIEW IF EXISTS cash_treasury_report_line CASCADE""")
-        self._cr.execute("""
-            CREATE OR REPLACE VIEW cash_treasury_report_line AS (
-                SELECT 
+    # =================================================
+    # PERIOD MODE
+    # =================================================
+    # With the cash_treasury_date_from / cash_treasury_date_to (and optional
+    # cash_treasury_account_ids) context keys, the model reads from a query
+    # instead of the stored table: the opening balance of each account before
+    # date_from comes from the nearest balance snapshot plus the lines after
+    # it (shown as an "Opening Balance" row), and the window only runs over
+    # the lines inside the period.
+    @property
+    def _table_query(self):
+        period = self._get_report_period()
+        if not period:
+            return None
+        date_from, date_to, account_ids = period
+
+        filters = [SQL(CASH_LINES_SCOPE)]
+        if account_ids:
+            filters.append(SQL("aml.account_id IN %s", tuple(account_ids)))
+        scope = SQL(" AND ").join(filters)
+
+        period_filters = [scope]
+        if date_from:
+            period_filters.append(SQL("aml.date >= %s", date_from))
+        if date_to:
+            period_filters.append(SQL("aml.date <= %s", date_to))
+
+        if not date_from:
+            return SQL("""
+                SELECT
                     aml.id AS id,
                     aml.date AS date,
                     aml.move_id AS move_id,
@@ -30,22 +68,284 @@ class CashTreasuryReportLine(models.Model):
                     aml.account_id AS account_id,
                     aml.debit AS debit,
                     aml.credit AS credit,
-                    TO_CHAR(
-                        SUM(aml.debit - aml.credit) OVER (
-                            PARTITION BY aml.account_id
-                            ORDER BY aml.date, aml.id
-                        ),
-                        'FM999,999,999.00'
-                    ) AS balance_str
+                    aml.company_currency_id AS currency_id,
+                    SUM(aml.debit - aml.credit) OVER (
+                        PARTITION BY aml.account_id
+                        ORDER BY aml.date, aml.id
+                    ) AS balance
                 FROM account_move_line aml
                 JOIN account_move am ON aml.move_id = am.id
-                JOIN account_account acc ON aml.account_id = acc.id
-                WHERE acc.account_type IN ('asset_cash', 'asset_bank')
-                  AND am.state = 'posted'
-                  AND EXISTS (
-                      SELECT 1 
-                      FROM account_journal aj 
-                      WHERE aj.default_account_id = acc.id
-                  )
+                JOIN cash_treasury_cash_account ca ON ca.account_id = aml.account_id
+                WHERE %s
+            """, SQL(" AND ").join(period_filters))
+
+        return SQL("""
+            WITH opening AS (%(opening)s)
+            SELECT
+                -opening.account_id AS id,
+                %(date_from)s::date AS date,
+                NULL::integer AS move_id,
+                %(opening_label)s::varchar AS name,
+                opening.journal_id AS journal_id,
+                NULL::varchar AS move_type,
+                opening.account_id AS account_id,
+                0.0 AS debit,
+                0.0 AS credit,
+                opening.currency_id AS currency_id,
+                opening.balance AS balance
+            FROM opening
+
+            UNION ALL
+
+            SELECT
+                aml.id,
+                aml.date,
+                aml.move_id,
+                am.name,
+                am.journal_id,
+                am.move_type,
+                aml.account_id,
+                aml.debit,
+                aml.credit,
+                aml.company_currency_id,
+                COALESCE(opening.balance, 0) + SUM(aml.debit - aml.credit) OVER (
+                    PARTITION BY aml.account_id
+                    ORDER BY aml.date, aml.id
+                )
+            FROM account_move_line aml
+            JOIN account_move am ON aml.move_id = am.id
+            JOIN cash_treasury_cash_account ca ON ca.account_id = aml.account_id
+            LEFT JOIN opening ON opening.account_id = aml.account_id
+            WHERE %(period)s
+        """,
+            opening=self._get_opening_query(date_from, account_ids),
+            period=SQL(" AND ").join(period_filters),
+            date_from=date_from,
+            opening_label=_("Opening Balance"),
+        )
+
+    # =================================================
+    # STORAGE
+    # =================================================
+    # The report used to be a view running a window over the whole posted
+    # history on every read. Rows now live in a real table (one row per cash
+    # move line, id = account.move.line id) holding the running balance, kept
+    # up to date by account.move when entries are posted or reset to draft.
+    def init(self):
+        # ordered like the running-balance windows, so the ledger of each
+        # account is read in index order instead of being sorted
+        create_index(
+            self._cr,
+            'cash_treasury_aml_posted_account_date_idx',
+            'account_move_line',
+            ['account_id', 'date', 'id'],
+            where="parent_state = 'posted'",
+        )
+
+        self._cr.execute("""
+            SELECT relkind FROM pg_class
+            WHERE relname = 'cash_treasury_report_line'
+        """)
+        row = self._cr.fetchone()
+        if row and row[0] == 'v':
+            self._cr.execute("""DROP VIEW IF EXISTS cash_treasury_report_line CASCADE""")
+            row = None
+
+        if row:
+            if not column_exists(self._cr, 'cash_treasury_report_line', 'currency_id'):
+                self._cr.execute("""
+                    ALTER TABLE cash_treasury_report_line ADD COLUMN currency_id integer;
+                    UPDATE cash_treasury_report_line l
+                    SET currency_id = aml.company_currency_id
+                    FROM account_move_line aml
+                    WHERE aml.id = l.id;
+                """)
+            return
+
+        self._cr.execute("""
+            CREATE TABLE cash_treasury_report_line (
+                id integer PRIMARY KEY REFERENCES account_move_line (id) ON DELETE CASCADE,
+                date date NOT NULL,
+                move_id integer NOT NULL,
+                name varchar,
+                journal_id integer,
+                move_type varchar,
+                account_id integer NOT NULL,
+                debit numeric NOT NULL DEFAULT 0,
+                credit numeric NOT NULL DEFAULT 0,
+                currency_id integer,
+                balance numeric NOT NULL DEFAULT 0
+            );
+            CREATE INDEX cash_treasury_report_line_account_date_idx
+                ON cash_treasury_report_line (account_id, date, id);
+            CREATE INDEX cash_treasury_report_line_move_idx
+                ON cash_treasury_report_line (move_id);
+
+            -- one row per cash account, touched by every balance update so
+            -- that concurrent postings on the same account conflict (and get
+            -- retried) instead of both shifting balances from stale snapshots
+            CREATE TABLE IF NOT EXISTS cash_treasury_report_account (
+                account_id integer PRIMARY KEY,
+                write_date timestamp NOT NULL DEFAULT (now() AT TIME ZONE 'UTC')
             );
-        """)
\ No newline at end of file
+        """)
+        self._rebuild()
+
+    def _rebuild(self, account_ids=None):
+        """Recompute the rows of ``account_ids`` (all accounts when None)
+        from the posted ledger."""
+        self.env.flush_all()
+        if account_ids is not None:
+            if not account_ids:
+                return
+            self._cr.execute("""
+                DELETE FROM cash_treasury_report_line
+                WHERE account_id IN %s
+            """, [tuple(account_ids)])
+            self._lock_accounts(account_ids)
+        else:
+            self._cr.execute("""DELETE FROM cash_treasury_report_line""")
+
+        self._cr.execute(SQL("""
+            INSERT INTO cash_treasury_report_line (
+                id, date, move_id, name, journal_id, move_type,
+                account_id, debit, credit, currency_id, balance
+            )
+            %s
+        """, self._get_rebuild_query(account_ids)))
+        self.invalidate_model()
+
+    def _get_rebuild_query(self, account_ids=None):
+        """SQL of the rows of ``account_ids`` (all accounts when None) with
+        their running balance. The window follows the order of the partial
+        ledger index created in init(), so it is computed without sorting."""
+        account_filter = SQL("TRUE")
+        if account_ids is not None:
+            account_filter = SQL("aml.account_id IN %s", tuple(account_ids))
+        return SQL(f"""
+            SELECT
+                aml.id,
+                aml.date,
+                aml.move_id,
+                am.name,
+                am.journal_id,
+                am.move_type,
+                aml.account_id,
+                aml.debit,
+                aml.credit,
+                aml.company_currency_id,
+                SUM(aml.debit - aml.credit) OVER (
+                    PARTITION BY aml.account_id
+                    ORDER BY aml.date, aml.id
+                )
+            FROM account_move_line aml
+            JOIN account_move am ON aml.move_id = am.id
+            JOIN cash_treasury_cash_account ca ON ca.account_id = aml.account_id
+            WHERE {CASH_LINES_SCOPE}
+              AND %s
+        """, account_filter)
+
+    def _sync_moves(self, moves):
+        """Bring the rows of ``moves`` in line with their current state and
+        shift the running balance of every later line on the same accounts.
+
+        Called after posting (rows appear) and after reset to draft (rows
+        disappear); backdated entries only rewrite the tail of the account
+        starting at their date.
+        """
+        if not moves:
+            return
+        self.env.flush_all()
+        move_ids = tuple(moves.ids)
+
+        self._cr.execute("""
+            DELETE FROM cash_treasury_report_line
+            WHERE move_id IN %s
+            RETURNING account_id, date
+        """, [move_ids])
+        touched = self._cr.fetchall()
+
+        self._cr.execute(f"""
+            INSERT INTO cash_treasury_report_line (
+                id, date, move_id, name, journal_id, move_type,
+                account_id, debit, credit, currency_id
+            )
+            SELECT
+                aml.id,
+                aml.date,
+                aml.move_id,
+                am.name,
+                am.journal_id,
+                am.move_type,
+                aml.account_id,
+                aml.debit,
+                aml.credit,
+                aml.company_currency_id
+            FROM account_move_line aml
+            JOIN account_move am ON aml.move_id = am.id
+            JOIN cash_treasury_cash_account ca ON ca.account_id = aml.account_id
+            WHERE aml.move_id IN %s
+              AND {CASH_LINES_SCOPE}
+            RETURNING account_id, date
+        """, [move_ids])
+        touched += self._cr.fetchall()
+
+        starts = {}
+        for account_id, date in touched:
+            if account_id not in starts or date < starts[account_id]:
+                starts[account_id] = date
+        self._shift_balances(starts)
+        self.env['cash.treasury.balance.snapshot']._invalidate(starts)
+        self.env['cash.treasury.daily.summary']._refresh(touched)
+        self.invalidate_model()
+
+    def _shift_balances(self, starts):
+        """Recompute running balances of each account in ``starts`` (a dict
+        account_id -> date) from that date on, seeded with the stored balance
+        of the last line before it."""
+        if not starts:
+            return
+        self._lock_accounts(starts)
+        account_ids = list(starts)
+        self._cr.execute("""
+            WITH start AS (
+                SELECT *
+                FROM unnest(%s::integer[], %s::date[]) AS s(account_id, date_from)
+            ),
+            seed AS (
+                SELECT s.account_id, s.date_from, COALESCE(prev.balance, 0) AS opening
+                FROM start s
+                LEFT JOIN LATERAL (
+                    SELECT p.balance
+                    FROM cash_treasury_report_line p
+                    WHERE p.account_id = s.account_id
+                      AND p.date < s.date_from
+                    ORDER BY p.date DESC, p.id DESC
+                    LIMIT 1
+                ) prev ON TRUE
+            ),
+            running AS (
+                SELECT
+                    l.id,
+                    seed.opening + SUM(l.debit - l.credit) OVER (
+                        PARTITION BY l.account_id
+                        ORDER BY l.date, l.id
+                    ) AS balance
+                FROM cash_treasury_report_line l
+                JOIN seed ON seed.account_id = l.account_id
+                         AND l.date >= seed.date_from
+            )
+            UPDATE cash_treasury_report_line t
+            SET balance = r.balance
+            FROM running r
+            WHERE t.id = r.id
+              AND t.balance IS DISTINCT FROM r.balance
+        """, [account_ids, [starts[a] for a in account_ids]])
+
+    def _lock_accounts(self, account_ids):
+        self._cr.execute("""
+            INSERT INTO cash_treasury_report_account (account_id)
+            SELECT unnest(%s::integer[])
+            ON CONFLICT (account_id)
+            DO UPDATE SET write_date = now() AT TIME ZONE 'UTC'
+        """, [sorted(account_ids)])
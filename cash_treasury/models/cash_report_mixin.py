@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from odoo import models, fields, api
+from odoo.tools import SQL
+
+
+class CashTreasuryBalanceMixin(models.AbstractModel):
+    """Shared by the treasury reports exposing a per-account running
+    ``balance`` column.
+
+    Summing running balances is meaningless, so grouped reads replace the
+    ``balance`` aggregate with the closing balance of each group: the balance
+    on the last line of every account in the group, added up over accounts.
+    """
+    _name = 'cash.treasury.balance.mixin'
+    _description = 'Cash Treasury Running Balance Report'
+
+    # columns ordering the lines of one account, oldest first
+    _balance_order = ('date', 'id')
+
+    @api.model
+    def _read_group(self, domain, groupby=(), aggregates=(), having=(), offset=0, limit=None, order=None):
+        rows = super()._read_group(
+            domain, groupby, aggregates, having=having, offset=offset, limit=limit, order=order,
+        )
+        if 'balance:sum' not in aggregates or not rows:
+            return rows
+        groupby = list(groupby)
+        index = len(groupby) + list(aggregates).index('balance:sum')
+        closing = self._get_closing_balances(domain, groupby)
+        return [
+            row[:index] + (closing.get(row[:len(groupby)], 0.0),) + row[index + 1:]
+            for row in rows
+        ]
+
+    @api.model
+    def _get_closing_balances(self, domain, groupby):
+        """Return {group key: closing balance} of every group of ``domain``
+        by ``groupby``, keyed like the rows of ``_read_group``, in a single
+        query: the last line of each account in each group, summed per group.
+        """
+        query = self._search(domain)
+        table = query.table
+        terms = [self._read_group_groupby(spec, query) for spec in groupby]
+        account = SQL.identifier(table, 'account_id')
+        query.order = SQL(", ").join([
+            *terms,
+            account,
+            *(SQL("%s DESC", SQL.identifier(table, column)) for column in self._balance_order),
+        ])
+        keys = [SQL.identifier(f"group_{index}") for index in range(len(terms))]
+        last_lines = query.select(SQL(
+            "DISTINCT ON (%s) %s",
+            SQL(", ").join([*terms, account]),
+            SQL(", ").join([
+                *(SQL("%s AS %s", term, key) for term, key in zip(terms, keys)),
+                SQL("%s AS balance", SQL.identifier(table, 'balance')),
+            ]),
+        ))
+        self.env.cr.execute(SQL(
+            "SELECT %s FROM (%s) last_line %s",
+            SQL(", ").join([*keys, SQL("COALESCE(SUM(last_line.balance), 0)")]),
+            last_lines,
+            SQL("GROUP BY %s", SQL(", ").join(keys)) if keys else SQL(),
+        ))
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return {}
+        columns = list(zip(*rows))
+        values = [
+            self._read_group_postprocess_groupby(spec, column)
+            for spec, column in zip(groupby, columns)
+        ]
+        return dict(zip(zip(*values), columns[-1])) if values else {(): columns[-1][0]}
+
+    # =================================================
+    # PERIOD MODE
+    # =================================================
+    def _get_report_period(self):
+        """Return (date_from, date_to, account_ids) from the context, or
+        None when the report is not restricted to a period."""
+        ctx = self.env.context
+        date_from = fields.Date.to_date(ctx.get('cash_treasury_date_from'))
+        date_to = fields.Date.to_date(ctx.get('cash_treasury_date_to'))
+        if not date_from and not date_to:
+            return None
+        return date_from, date_to, ctx.get('cash_treasury_account_ids') or []
+
+    def _get_opening_query(self, date_from, account_ids):
+        """SQL of the (account_id, journal_id, currency_id, balance) opening
+        balances before ``date_from``, seeded from the balance snapshots."""
+        return self.env['cash.treasury.balance.snapshot']._balance_at_query(
+            date_from - timedelta(days=1), account_ids,
+        )
@@ -1,10 +1,15 @@
-from odoo import models, fields, tools
+from odoo import models, fields, api, tools
+from odoo.tools import SQL
+from odoo.tools.sql import constraint_definition, create_index, index_exists, table_exists
 
 class CashTransactionAnalysis(models.Model):
     _name = 'cash.transaction.analysis'
+    _inherit = 'cash.treasury.balance.mixin'
     _description = 'Cash Transaction Analysis'
     _auto = False
-    _order = 'date'
+    # plain columns only (ordering on move_id would join account.move and
+    # follow its order); pair ids are handed out in ledger order
+    _order = 'date, id'
 
     date = fields.Date(string='Date')
     journal_id = fields.Many2one('account.journal', string='Journal')
@@ -15,7 +20,7 @@ class CashTransactionAnalysis(models.Model):
     debit = fields.Monetary(string='Debit')
     credit = fields.Monetary(string='Credit')
 
-    balance_str = fields.Char(string='Balance')
+    balance = fields.Monetary(string='Balance')
 
     currency_id = fields.Many2one('res.currency', string='Currency')
 
@@ -23,86 +28,316 @@ class CashTransactionAnalysis(models.Model):
     counter_partner_id = fields.Many2one('res.partner', string='Counter Partner')
     counter_label = fields.Char(string='Counter Label')
 
+    # =================================================
+    # PERIOD MODE
+    # =================================================
+    # Same context keys as the treasury report: the window only runs over the
+    # pairs inside the period, seeded with the opening balance of the account
+    # taken from the balance snapshots.
+    @property
+    def _table_query(self):
+        period = self._get_report_period()
+        if not period:
+            return None
+        date_from, date_to, account_ids = period
+
+        filters = [SQL("TRUE")]
+        if account_ids:
+            filters.append(SQL("cp.account_id IN %s", tuple(account_ids)))
+        if date_from:
+            filters.append(SQL("cp.date >= %s", date_from))
+        if date_to:
+            filters.append(SQL("cp.date <= %s", date_to))
+
+        opening = SQL("SELECT NULL::integer AS account_id, 0.0 AS balance WHERE FALSE")
+        if date_from:
+            opening = self._get_opening_query(date_from, account_ids)
+
+        return SQL("""
+            WITH opening AS (%(opening)s)
+            SELECT
+                cp.id,
+                cp.cash_line_id,
+                cp.counter_line_id,
+                cp.date,
+                cp.account_id,
+                cp.journal_id,
+                cp.partner_id,
+                cp.move_id,
+                cp.label,
+                cp.counter_account_id,
+                cp.counter_partner_id,
+                cp.counter_label,
+                cp.debit,
+                cp.credit,
+                cp.currency_id,
+                COALESCE(opening.balance, 0) + SUM(cp.credit - cp.debit) OVER (
+                    PARTITION BY cp.account_id
+                    ORDER BY cp.date, cp.id
+                    ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+                ) AS balance
+            FROM cash_treasury_counterpart_line cp
+            LEFT JOIN opening ON opening.account_id = cp.account_id
+            WHERE %(filters)s
+        """, opening=opening, filters=SQL(" AND ").join(filters))
+
+    # =================================================
+    # STORAGE
+    # =================================================
+    # Each (cash line, counterpart line) pair of a posted move is stored once
+    # in cash_treasury_counterpart_line when the move is posted (and removed
+    # when it is reset to draft), together with the running balance of its
+    # account, so the view is a plain projection of the table: filters and
+    # keyset conditions reach its indexes.
     def init(self):
+        # counterpart lines are looked up per posted move
+        create_index(
+            self._cr,
+            'cash_treasury_aml_posted_move_sequence_idx',
+            'account_move_line',
+            ['move_id', 'sequence', 'id'],
+            where="parent_state = 'posted'",
+        )
+
         self._cr.execute("""DROP VIEW IF EXISTS cash_transaction_analysis CASCADE""")
+
+        # the table only holds derived data: tables of former versions (ids
+        # computed from the line ids, no stored balance, balances ordered by
+        # move) are rebuilt
+        if table_exists(self._cr, 'cash_treasury_counterpart_line') and (
+            not constraint_definition(
+                self._cr, 'cash_treasury_counterpart_line', 'cash_treasury_counterpart_line_pair_uniq',
+            )
+            or index_exists(self._cr, 'cash_treasury_counterpart_line_keyset_idx')
+        ):
+            self._cr.execute("""DROP TABLE cash_treasury_counterpart_line""")
+
+        if not table_exists(self._cr, 'cash_treasury_counterpart_line'):
+            self._cr.execute("""
+                CREATE TABLE cash_treasury_counterpart_line (
+                    -- a plain serial: the ids must stay exact as JavaScript
+                    -- numbers in the web client
+                    id bigserial PRIMARY KEY,
+                    cash_line_id integer NOT NULL REFERENCES account_move_line (id) ON DELETE CASCADE,
+                    counter_line_id integer NOT NULL REFERENCES account_move_line (id) ON DELETE CASCADE,
+                    move_id integer NOT NULL,
+                    date date NOT NULL,
+                    account_id integer NOT NULL,
+                    journal_id integer,
+                    partner_id integer,
+                    label varchar,
+                    counter_account_id integer,
+                    counter_partner_id integer,
+                    counter_label varchar,
+                    debit numeric NOT NULL DEFAULT 0,
+                    credit numeric NOT NULL DEFAULT 0,
+                    currency_id integer,
+                    balance numeric NOT NULL DEFAULT 0,
+                    CONSTRAINT cash_treasury_counterpart_line_pair_uniq
+                        UNIQUE (cash_line_id, counter_line_id)
+                );
+                CREATE INDEX cash_treasury_counterpart_line_account_date_id_idx
+                    ON cash_treasury_counterpart_line (account_id, date, id);
+                CREATE INDEX cash_treasury_counterpart_line_move_idx
+                    ON cash_treasury_counterpart_line (move_id);
+                -- keyset pages (see fetch_page) in the order of the model
+                CREATE INDEX cash_treasury_counterpart_line_date_id_idx
+                    ON cash_treasury_counterpart_line (date, id);
+            """)
+            self._rebuild()
+
         self._cr.execute("""
             CREATE OR REPLACE VIEW cash_transaction_analysis AS (
-                WITH cash_per_move AS (
-                    SELECT 
-                        aml.move_id,
-                        aml.account_id,
-                        SUM(aml.debit - aml.credit) as total_cash_net
-                    FROM account_move_line aml
-                    JOIN account_account acc ON aml.account_id = acc.id
-                    JOIN account_move am ON aml.move_id = am.id
-                    WHERE acc.account_type IN ('asset_cash', 'asset_bank')
-                      AND am.state = 'posted'
-                      AND EXISTS (
-                          SELECT 1
-                          FROM account_journal aj
-                          WHERE aj.default_account_id = acc.id
-                      )
-                    GROUP BY aml.move_id, aml.account_id
-                ),
-                ordered_lines AS (
-                    SELECT 
-                        aml2.id as line_id,
-                        am.date,
-                        aml.account_id,
-                        am.journal_id,
-                        aml.partner_id,
-                        aml.move_id,
-                        aml.name,
-                        aml2.account_id as counter_account_id,
-                        aml2.partner_id as counter_partner_id,
-                        aml2.name as counter_label,
-                        aml2.debit,
-                        aml2.credit,
-                        aml2.company_currency_id,
-                        aml2.credit - aml2.debit as line_amount,
-                        ROW_NUMBER() OVER (
-                            PARTITION BY aml.account_id 
-                            ORDER BY am.date, aml.move_id, aml2.sequence, aml2.id
-                        ) as seq_num,
-                        SUM(aml2.credit - aml2.debit) OVER (
-                            PARTITION BY aml.account_id
-                            ORDER BY am.date, aml.move_id, aml2.sequence, aml2.id
-                            ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
-                        ) as running_total
-                    FROM account_move_line aml
-                    JOIN account_account acc ON aml.account_id = acc.id
-                    JOIN account_move am ON aml.move_id = am.id
-                    JOIN account_move_line aml2 ON aml2.move_id = aml.move_id 
-                        AND aml2.account_id != aml.account_id
-                    WHERE acc.account_type IN ('asset_cash', 'asset_bank')
-                      AND am.state = 'posted'
-                      AND EXISTS (
-                          SELECT 1
-                          FROM account_journal aj
-                          WHERE aj.default_account_id = acc.id
-                      )
-                )
                 SELECT 
-                    row_number() OVER () as id,
-                    ol.date,
-                    ol.account_id,
-                    ol.journal_id,
-                    ol.partner_id,
-                    ol.move_id,
-                    ol.name as label,
-                    ol.counter_account_id,
-                    ol.counter_partner_id,
-                    ol.counter_label,
-                    ol.debit,
-                    ol.credit,
-                    ol.company_currency_id as currency_id,
-
-                    TO_CHAR(
-                        ol.running_total,
-                        'FM999,999,999.00'
-                    ) as balance_str
-
-                FROM ordered_lines ol
-                ORDER BY ol.date, ol.move_id, ol.seq_num
+                    cp.id,
+                    cp.cash_line_id,
+                    cp.counter_line_id,
+                    cp.date,
+                    cp.account_id,
+                    cp.journal_id,
+                    cp.partner_id,
+                    cp.move_id,
+                    cp.label,
+                    cp.counter_account_id,
+                    cp.counter_partner_id,
+                    cp.counter_label,
+                    cp.debit,
+                    cp.credit,
+                    cp.currency_id,
+                    cp.balance
+                FROM cash_treasury_counterpart_line cp
             )
         """)
+
+    def _insert_pairs(self, where, params, returning=False):
+        """Store the (cash line, counterpart line) pairs of the posted moves
+        matching ``where`` (a condition on the cash line ``aml``), without
+        their running balance. With ``returning``, return the (account_id,
+        date) of the inserted pairs."""
+        self._cr.execute(f"""
+            INSERT INTO cash_treasury_counterpart_line (
+                cash_line_id, counter_line_id, move_id, date, account_id,
+                journal_id, partner_id, label, counter_account_id,
+                counter_partner_id, counter_label, debit, credit, currency_id
+            )
+            SELECT 
+                aml.id AS cash_line_id,
+                aml2.id AS counter_line_id,
+                aml.move_id,
+                am.date,
+                aml.account_id,
+                am.journal_id,
+                aml.partner_id,
+                aml.name AS label,
+                aml2.account_id AS counter_account_id,
+                aml2.partner_id AS counter_partner_id,
+                aml2.name AS counter_label,
+                aml2.debit,
+                aml2.credit,
+                aml2.company_currency_id AS currency_id
+            FROM account_move_line aml
+            JOIN cash_treasury_cash_account ca ON ca.account_id = aml.account_id
+            JOIN account_move am ON aml.move_id = am.id
+            JOIN account_move_line aml2 ON aml2.move_id = aml.move_id 
+                AND aml2.account_id != aml.account_id
+                AND aml2.parent_state = 'posted'
+            WHERE aml.parent_state = 'posted'
+              AND {where}
+            -- ids are handed out in ledger order
+            ORDER BY am.date, aml.move_id, aml.id, aml2.id
+            {"RETURNING account_id, date" if returning else ""}
+        """, params)
+        return self._cr.fetchall() if returning else None
+
+    def _rebuild(self, account_ids=None):
+        """Recompute the stored pairs of the cash ``account_ids`` (all when
+        None) and their running balances from the posted ledger."""
+        self.env.flush_all()
+        if account_ids is None:
+            self._cr.execute("""DELETE FROM cash_treasury_counterpart_line""")
+            self._insert_pairs("TRUE", {})
+            self._cr.execute("""
+                SELECT account_id, MIN(date)
+                FROM cash_treasury_counterpart_line
+                GROUP BY account_id
+            """)
+            self._shift_balances(dict(self._cr.fetchall()))
+        elif account_ids:
+            params = {'account_ids': tuple(account_ids)}
+            self._cr.execute("""
+                DELETE FROM cash_treasury_counterpart_line
+                WHERE account_id IN %(account_ids)s
+            """, params)
+            self._insert_pairs(
+                """aml.move_id IN (
+                    SELECT move_id FROM account_move_line
+                    WHERE account_id IN %(account_ids)s
+                      AND parent_state = 'posted'
+                ) AND aml.account_id IN %(account_ids)s""",
+                params,
+            )
+            self._cr.execute("""
+                SELECT account_id, MIN(date)
+                FROM cash_treasury_counterpart_line
+                WHERE account_id IN %(account_ids)s
+                GROUP BY account_id
+            """, params)
+            self._shift_balances(dict(self._cr.fetchall()))
+        self.invalidate_model()
+
+    def _sync_moves(self, moves):
+        """Bring the stored pairs of ``moves`` in line with their state and
+        shift the running balance of every later pair on the same accounts."""
+        if not moves:
+            return
+        self.env.flush_all()
+        params = {'move_ids': tuple(moves.ids)}
+        self._cr.execute("""
+            DELETE FROM cash_treasury_counterpart_line
+            WHERE move_id IN %(move_ids)s
+            RETURNING account_id, date
+        """, params)
+        touched = self._cr.fetchall()
+        touched += self._insert_pairs("aml.move_id IN %(move_ids)s", params, returning=True)
+
+        starts = {}
+        for account_id, date in touched:
+            if account_id not in starts or date < starts[account_id]:
+                starts[account_id] = date
+        self._shift_balances(starts)
+        self.invalidate_model()
+
+    def _shift_balances(self, starts):
+        """Recompute running balances of each account in ``starts`` (a dict
+        account_id -> date) from that date on, seeded with the stored balance
+        of the last pair before it. Same as the treasury report, on the
+        counterpart amounts."""
+        if not starts:
+            return
+        self.env['cash.treasury.report.line']._lock_accounts(starts)
+        account_ids = list(starts)
+        self._cr.execute("""
+            WITH start AS (
+                SELECT *
+                FROM unnest(%s::integer[], %s::date[]) AS s(account_id, date_from)
+            ),
+            seed AS (
+                SELECT s.account_id, s.date_from, COALESCE(prev.balance, 0) AS opening
+                FROM start s
+                LEFT JOIN LATERAL (
+                    SELECT p.balance
+                    FROM cash_treasury_counterpart_line p
+                    WHERE p.account_id = s.account_id
+                      AND p.date < s.date_from
+                    ORDER BY p.date DESC, p.id DESC
+                    LIMIT 1
+                ) prev ON TRUE
+            ),
+            running AS (
+                SELECT
+                    cp.id,
+                    seed.opening + SUM(cp.credit - cp.debit) OVER (
+                        PARTITION BY cp.account_id
+                        ORDER BY cp.date, cp.id
+                    ) AS balance
+                FROM cash_treasury_counterpart_line cp
+                JOIN seed ON seed.account_id = cp.account_id
+                         AND cp.date >= seed.date_from
+            )
+            UPDATE cash_treasury_counterpart_line t
+            SET balance = r.balance
+            FROM running r
+            WHERE t.id = r.id
+              AND t.balance IS DISTINCT FROM r.balance
+        """, [account_ids, [starts[a] for a in account_ids]])
+
+    # =================================================
+    # KEYSET PAGINATION
+    # =================================================
+    @api.model
+    def fetch_page(self, domain, field_names, after=None, limit=80):
+        """Return the next ``limit`` rows matching ``domain`` in report order,
+        starting after the ``after`` key, without OFFSET.
+
+        ``after`` is the ``next`` value returned for the previous page
+        ([date, id]); the result is ``{'records': [...], 'next':
+        key or False}``. The running balance is stored, so each page is an
+        index range scan of the counterpart table.
+        """
+        query = self._search(domain)
+        # a row comparison, unlike a disjunction of the key columns, is
+        # turned into an index range
+        columns = [SQL.identifier(query.table, name) for name in ('date', 'id')]
+        if after:
+            query.add_where(SQL("(%s, %s) > (%s::date, %s)", *columns, *after))
+        query.order = SQL(", ").join(columns)
+        query.limit = limit
+        self._cr.execute(query.select())
+        records = self.browse(row[0] for row in self._cr.fetchall())
+        last = records[-1:]
+        return {
+            'records': records.read(field_names),
+            'next': len(records) == limit and [
+                fields.Date.to_string(last.date), last.id,
+            ],
+        }
@@ -0,0 +1,792 @@
+import logging
+
+from psycopg2 import errors
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import SQL, float_compare, mute_logger, split_every
+
+_logger = logging.getLogger(__name__)
+
+# documents handled per savepoint by the bulk actions
+BULK_CHUNK_SIZE = 50
+# vouchers created per savepoint by the bulk import
+IMPORT_BATCH_SIZE = 500
+# errors caused by concurrent transactions rather than by the documents:
+# retrying in the same (REPEATABLE READ) transaction would fail again
+CONCURRENCY_ERRORS = (errors.SerializationFailure, errors.DeadlockDetected, errors.LockNotAvailable)
+
+
+class CashTreasuryVoucherMixin(models.AbstractModel):
+    """Posting engine shared by cash in and cash out vouchers.
+
+    A whole recordset is posted in one pass: every document is validated
+    first, then all the journal entries are created with a single ``create``
+    and posted with a single ``action_post``, instead of one round of
+    create/post/write per document.
+
+    Cash in and cash out vouchers have the same structure (counterpart
+    account or partner, multi account lines, invoice allocations) and only
+    differ by the ``_voucher_*`` attributes below: field names, the partner
+    account and the side of the counterpart lines.
+    """
+    _name = "cash.treasury.voucher.mixin"
+    _description = "Cash Treasury Voucher Posting"
+
+    # date of the journal entry, set by the user before posting
+    _voucher_date_field = None
+    # state reached once the journal entry is posted
+    _voucher_done_state = None
+    # "in" / "out": which voucher sequence of the journal numbers documents
+    _voucher_sequence_kind = None
+    # "account" / "partner" selection of the counterpart of the voucher
+    _voucher_party_type_field = None
+    # flag and amount field of the invoice allocations
+    _voucher_loaded_field = None
+    _voucher_allocation_amount_field = None
+    # move type of the allocated invoices, payment type of the methods
+    _voucher_invoice_type = None
+    _voucher_payment_type = None
+    # partner account of the partner vouchers (receivable / payable)
+    _voucher_partner_account_field = None
+    # side of the counterpart lines: -1 credits them (money in), 1 debits
+    # them (money out); the cash line takes the other side
+    _voucher_counterpart_sign = None
+
+    # idempotency key of the vouchers created by import_vouchers()
+    import_key = fields.Char(readonly=True, copy=False)
+
+    _sql_constraints = [
+        ("import_key_uniq", "unique(import_key)", "A voucher was already imported with this key."),
+    ]
+
+    def _post_vouchers(self):
+        """Create, post and reconcile the journal entries of ``self``.
+
+        Returns the posted moves, in the order of ``self``.
+        """
+        self._lock_vouchers()
+        self._check_postable()
+        names = self._next_voucher_names()
+
+        rates = {}
+        pay_lines = {}
+        moves = self.env["account.move"].create([
+            rec._prepare_move_vals(names[rec.id], rates, pay_lines) for rec in self
+        ])
+        moves.action_post()
+        self._reconcile_allocations(moves, pay_lines)
+
+        for rec, move in zip(self, moves):
+            rec.write({
+                "name": names[rec.id],
+                "journal_entry_id": move.id,
+            })
+        self.write({"state": self._voucher_done_state})
+
+        self.env["cash.treasury.daily.summary"]._refresh_moves(moves)
+        return moves
+
+    # =================================================
+    # BULK ACTIONS
+    # =================================================
+    def action_approve_bulk(self):
+        """Approve the documents of ``self`` that can be, and list the others
+        with their error."""
+        return self._get_bulk_result_action(_("Approve"), self._run_isolated("action_approve"))
+
+    def action_post_bulk(self):
+        """Post the documents of ``self`` that can be, and list the others
+        with their error."""
+        return self._get_bulk_result_action(_("Post"), self._run_isolated("_post_vouchers"))
+
+    def action_validate_for_posting(self):
+        """Check the documents of ``self`` before posting them and list every
+        problem found."""
+        problems = self._get_posting_problems()
+        if problems:
+            return self._get_bulk_result_action(_("Check Before Posting"), problems)
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "type": "success",
+                "message": _("%s document(s) ready to be posted.", len(self)),
+                "sticky": False,
+            },
+        }
+
+    def _run_isolated(self, method, chunk_size=BULK_CHUNK_SIZE):
+        """Call ``method`` on ``self`` by chunks, each in its own savepoint.
+
+        A failing chunk is rolled back and retried document by document, so
+        that only the faulty documents are left out. Returns the list of
+        (record, error message) of the documents that failed.
+
+        Concurrency errors are raised: they are not caused by the documents,
+        and the whole transaction has to be retried.
+        """
+        failures = []
+        for ids in split_every(chunk_size, self.ids):
+            chunk = self.browse(ids)
+            try:
+                with self.env.cr.savepoint():
+                    getattr(chunk, method)()
+                continue
+            except CONCURRENCY_ERRORS:
+                raise
+            except Exception as e:
+                if len(chunk) == 1:
+                    failures.append((chunk, self._get_bulk_error(chunk, e)))
+                    continue
+            for rec in chunk:
+                try:
+                    with self.env.cr.savepoint():
+                        getattr(rec, method)()
+                except CONCURRENCY_ERRORS:
+                    raise
+                except Exception as e:
+                    failures.append((rec, self._get_bulk_error(rec, e)))
+        return failures
+
+    @api.model
+    def _get_bulk_error(self, record, error):
+        if not isinstance(error, UserError):
+            _logger.warning("%s failed on %s", self._name, record, exc_info=True)
+        return str(error.args[0]) if isinstance(error, UserError) else repr(error)
+
+    def _get_bulk_result_action(self, operation, failures):
+        result = self.env["cash.treasury.bulk.result"].create({
+            "operation": operation,
+            "res_model": self._name,
+            "done_count": len(self) - len({rec.id for rec, _error in failures}),
+            "line_ids": [
+                (0, 0, {"res_id": rec.id, "document": rec.display_name, "error": error})
+                for rec, error in failures
+            ],
+        })
+        return {
+            "type": "ir.actions.act_window",
+            "name": _("%s: Result", operation),
+            "res_model": result._name,
+            "res_id": result.id,
+            "views": [(False, "form")],
+            "target": "new",
+        }
+
+    def action_post_in_background(self):
+        """Queue ``self`` for posting by the background worker and open the
+        posting jobs."""
+        jobs = self.env["cash.treasury.posting.job"]._enqueue(self)
+        return jobs._get_action()
+
+    def _cancel_vouchers(self):
+        """Reverse the journal entries of ``self`` and reset them to draft.
+
+        All entries are unreconciled, reversed, posted and reconciled with
+        their reversal by the native batched reversal.
+        """
+        self._lock_vouchers()
+        missing = self.filtered(lambda r: not r.journal_entry_id)
+        if missing:
+            raise UserError(_(
+                "No journal entry found on these documents:\n%s",
+                "\n".join(missing.mapped("display_name")),
+            ))
+
+        moves = self.journal_entry_id
+        moves.line_ids.remove_move_reconcile()
+
+        today = fields.Date.context_today(self)
+        reversals = moves._reverse_moves(
+            [{"date": today, "ref": f"Reversal of {move.ref or move.name}"} for move in moves],
+            cancel=True,
+        )
+        reversal_of = {reversal.reversed_entry_id: reversal for reversal in reversals}
+
+        for rec in self:
+            rec.reversal_entry_id = reversal_of[rec.journal_entry_id]
+        self.allocation_line_ids.move_line_id = False
+        self.write({
+            "state": "draft",
+            "journal_entry_id": False,
+            "name": False,
+            self._voucher_date_field: False,
+        })
+
+        self.env["cash.treasury.daily.summary"]._refresh_moves(moves | reversals)
+
+    def _lock_vouchers(self):
+        """Lock the rows of ``self`` before changing their state, failing
+        right away if another transaction holds or has changed them, so
+        that a document is never posted (or reversed) twice."""
+        if not self:
+            return
+        try:
+            with mute_logger("odoo.sql_db"):
+                self.env.cr.execute(SQL(
+                    "SELECT id FROM %s WHERE id IN %s FOR UPDATE NOWAIT",
+                    SQL.identifier(self._table), tuple(self.ids),
+                ))
+        except (errors.LockNotAvailable, errors.SerializationFailure):
+            raise UserError(_(
+                "These documents are already being posted by another user. "
+                "Reload them and try again."
+            )) from None
+        # the checks must see the state of the locked rows
+        self.invalidate_recordset(["state", "journal_entry_id"])
+
+    def _next_voucher_names(self):
+        """Return {record id: number}.
+
+        Numbers are reserved in one block per journal and month (the
+        sequence prefix holds the month), in the order of ``self``.
+        """
+        groups = {}
+        for rec in self:
+            date = rec[self._voucher_date_field]
+            groups.setdefault((rec.journal_id, date.year, date.month), []).append(rec)
+
+        names = {}
+        for (journal, _year, _month), records in groups.items():
+            sequence = journal._get_cash_treasury_sequence(self._voucher_sequence_kind)
+            numbers = sequence._cash_treasury_reserve(
+                len(records), records[0][self._voucher_date_field],
+            )
+            names.update(zip((rec.id for rec in records), numbers))
+        return names
+
+    def _reconcile_allocations(self, moves, pay_lines):
+        """Link every allocation to the counterpart line generated for it and
+        reconcile all the invoices of the batch in one operation.
+
+        ``pay_lines`` is {record id: [(allocation, index of its line in the
+        entry)]}, as filled by ``_prepare_move_vals``.
+        """
+        plan = {}
+        for rec, move in zip(self, moves):
+            allocations = rec._get_posted_allocations()
+            mapping = pay_lines.get(rec.id, [])
+            if len(mapping) != len(allocations):
+                raise UserError(_(
+                    "%(document)s: the journal entry has %(lines)s payment lines for %(invoices)s selected invoices.",
+                    document=rec.display_name, lines=len(mapping), invoices=len(allocations),
+                ))
+            if not mapping:
+                continue
+            # lines are created in the order of the line_ids commands
+            move_lines = move.line_ids.sorted("id")
+            for allocation, index in mapping:
+                pay_line = move_lines[index]
+                allocation.move_line_id = pay_line
+                account = pay_line.account_id
+                if not account.reconcile:
+                    continue
+                inv_lines = allocation.invoice_id.line_ids.filtered(
+                    lambda l: l.account_id == account and not l.reconciled
+                )
+                if inv_lines:
+                    # an invoice paid by several allocations is reconciled
+                    # with all of them at once
+                    plan.setdefault(allocation.invoice_id, inv_lines)
+                    plan[allocation.invoice_id] |= pay_line
+        if plan:
+            self.env["account.move.line"]._reconcile_plan(list(plan.values()))
+
+    @api.model
+    def _get_batch_rate(self, rates, from_currency, to_currency, company, date):
+        """Conversion rate from ``from_currency`` to ``to_currency``, looked
+        up once per (currencies, company, date) in the ``rates`` dict of the
+        posting batch."""
+        key = (from_currency.id, to_currency.id, company.id, date)
+        if key not in rates:
+            rates[key] = self.env["res.currency"]._get_conversion_rate(
+                from_currency, to_currency, company, date,
+            )
+        return rates[key]
+
+    # =================================================
+    # BULK IMPORT
+    # =================================================
+    @api.model
+    def import_vouchers(self, rows):
+        """Create draft vouchers from external payloads, in batches.
+
+        Each row is a dict with:
+
+        - ``key``: idempotency key (required); a key already imported is
+          answered with the existing voucher instead of a new one
+        - ``journal``: journal code (optional when the user has one journal)
+        - ``payment_method``: payment method code (default ``manual``)
+        - ``date`` and ``notes`` (optional)
+        - either ``account`` (account code) or ``partner`` (partner
+          reference) with ``amount``, or ``lines``, multi account lines
+          ``{"account", "amount", "notes"}``
+        - ``invoices``: allocations of a partner voucher, ``{"number",
+          "amount"}``; the amount of the voucher is their total
+
+        References are resolved with one search per kind for all the rows
+        and every row is validated before anything is created. Returns one
+        result per row, in order: ``{"key", "id"}`` (plus ``"existing":
+        True`` for a key already imported) or ``{"key", "error"}``.
+        """
+        refs = self._resolve_import_refs(rows)
+        results = [None] * len(rows)
+        to_create = []
+        seen = set()
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                results[index] = {"key": None, "error": _("A row must be an object.")}
+                continue
+            key = row.get("key")
+            if not key or not isinstance(key, str):
+                results[index] = {"key": key, "error": _("Missing import key.")}
+                continue
+            if key in seen:
+                results[index] = {"key": key, "error": _("Duplicate import key in the payload.")}
+                continue
+            seen.add(key)
+            if key in refs["existing"]:
+                results[index] = {"key": key, "id": refs["existing"][key], "existing": True}
+                continue
+            vals, problems = self._prepare_import_vals(row, refs)
+            if problems:
+                results[index] = {"key": key, "error": "\n".join(problems)}
+            else:
+                to_create.append((index, vals))
+
+        for batch in split_every(IMPORT_BATCH_SIZE, to_create):
+            self._create_import_batch(batch, results)
+        return results
+
+    @api.model
+    def _resolve_import_refs(self, rows):
+        """Look up everything the ``rows`` refer to, one search per kind."""
+        company = self.env.company
+
+        def collect(key, sub=None):
+            # malformed rows and items are reported by _prepare_import_vals
+            values = set()
+            for row in rows:
+                if not isinstance(row, dict):
+                    continue
+                items = row.get(sub) if sub else [row]
+                if not isinstance(items, list):
+                    continue
+                values.update(
+                    item[key] for item in items
+                    if isinstance(item, dict) and isinstance(item.get(key), str)
+                )
+            return list(values)
+
+        keys = collect("key")
+        existing = self.sudo().search_fetch([("import_key", "in", keys)], ["import_key"]) if keys else self
+
+        Journal = self.env["account.journal"]
+        journal_domain = [
+            ("code", "in", collect("journal")),
+            ("type", "in", ("cash", "bank")),
+            *Journal._check_company_domain(company),
+        ]
+        allowed_journal_ids = self.env.user._cash_treasury_allowed_ids(company.ids)[0]
+        if not self.env.user.has_group("base.group_system"):
+            journal_domain.append(("id", "in", allowed_journal_ids))
+
+        methods = self.env["account.payment.method"].search_fetch([
+            ("payment_type", "=", self._voucher_payment_type),
+            ("code", "in", collect("payment_method") + ["manual"]),
+        ], ["code"])
+
+        partners = {}
+        Partner = self.env["res.partner"]
+        for partner in Partner.search_fetch([
+            ("ref", "in", collect("partner")),
+            *Partner._check_company_domain(company),
+        ], ["ref", "commercial_partner_id"]):
+            partners.setdefault(partner.ref, []).append(partner)
+
+        Account = self.env["account.account"].with_company(company)
+        account_codes = collect("account") + collect("account", "lines")
+        accounts = Account.search_fetch([
+            ("code", "in", account_codes),
+            *Account._check_company_domain(company),
+        ], ["code"])
+
+        invoices = self.env["account.move"].search_fetch([
+            ("name", "in", collect("number", "invoices")),
+            ("move_type", "=", self._voucher_invoice_type),
+            ("state", "=", "posted"),
+            ("company_id", "=", company.id),
+        ], ["name", "commercial_partner_id", "amount_residual"])
+
+        return {
+            "company": company,
+            "existing": {voucher.import_key: voucher.id for voucher in existing},
+            "journals": {journal.code: journal.id for journal in Journal.search_fetch(journal_domain, ["code"])},
+            # journal of the rows without one, as create() would default it
+            "default_journal_id": allowed_journal_ids[0] if len(allowed_journal_ids) == 1 else False,
+            "methods": {method.code: method.id for method in methods},
+            "partners": partners,
+            "accounts": {account.code: account.id for account in accounts},
+            "invoices": {invoice.name: invoice for invoice in invoices},
+        }
+
+    @api.model
+    def _prepare_import_vals(self, row, refs):
+        """Return (create values, problems) of an import ``row``."""
+        company = refs["company"]
+        rounding = company.currency_id.rounding
+        problems = []
+        vals = {"import_key": row["key"], "company_id": company.id}
+
+        for name in ("lines", "invoices"):
+            items = row.get(name)
+            if items is not None and (
+                not isinstance(items, list) or not all(isinstance(item, dict) for item in items)
+            ):
+                problems.append(_("%s must be a list of objects.", name))
+        if problems:
+            return vals, problems
+
+        def lookup(kind, value):
+            # references are strings; anything else is simply not found
+            return refs[kind].get(value) if isinstance(value, str) else None
+
+        if row.get("journal"):
+            vals["journal_id"] = lookup("journals", row["journal"])
+            if not vals["journal_id"]:
+                problems.append(_("Unknown or not allowed journal %s.", row["journal"]))
+        elif refs["default_journal_id"]:
+            vals["journal_id"] = refs["default_journal_id"]
+        else:
+            problems.append(_("A journal is required: you can use several journals, or none."))
+        method = row.get("payment_method") or "manual"
+        vals["payment_method_id"] = lookup("methods", method)
+        if not vals["payment_method_id"]:
+            problems.append(_("Unknown payment method %s.", method))
+        for name in ("date", "notes"):
+            if row.get(name):
+                vals[name] = row[name]
+
+        def account_id(code):
+            account = lookup("accounts", code)
+            if not account:
+                problems.append(_("Unknown account %s.", code))
+            return account
+
+        def positive(amount):
+            if (
+                not isinstance(amount, (int, float)) or isinstance(amount, bool)
+                or float_compare(amount, 0.0, precision_rounding=rounding) <= 0
+            ):
+                problems.append(_("Amounts must be numbers greater than zero."))
+                return False
+            return True
+
+        if row.get("lines"):
+            if row.get("partner") or row.get("account") or row.get("invoices"):
+                problems.append(_("Multi account rows only take lines."))
+            vals.update({
+                self._voucher_party_type_field: "account",
+                "multi_account": True,
+                "multi_account_line_ids": [
+                    (0, 0, {
+                        "account_id": account_id(line.get("account")),
+                        "amount": line.get("amount"),
+                        "notes": line.get("notes"),
+                    })
+                    for line in row["lines"]
+                    if positive(line.get("amount"))
+                ],
+            })
+
+        elif row.get("partner"):
+            candidates = lookup("partners", row["partner"]) or []
+            if len(candidates) != 1:
+                problems.append(
+                    _("Unknown partner %s.", row["partner"]) if not candidates
+                    else _("Several partners have the reference %s.", row["partner"])
+                )
+                return vals, problems
+            partner = candidates[0]
+            vals.update({
+                self._voucher_party_type_field: "partner",
+                "partner_id": partner.id,
+            })
+            if row.get("invoices"):
+                allocations = []
+                total = 0.0
+                for line in row["invoices"]:
+                    invoice = lookup("invoices", line.get("number"))
+                    if not invoice:
+                        problems.append(_("Unknown or unposted invoice %s.", line.get("number")))
+                    elif invoice.commercial_partner_id != partner.commercial_partner_id:
+                        problems.append(_("Invoice %s belongs to another partner.", invoice.name))
+                    elif positive(line.get("amount")):
+                        total += line["amount"]
+                        if float_compare(line["amount"], invoice.amount_residual, precision_rounding=rounding) > 0:
+                            problems.append(_("Amount of invoice %s exceeds its residual.", invoice.name))
+                        allocations.append((0, 0, {
+                            "invoice_id": invoice.id,
+                            "selected": True,
+                            self._voucher_allocation_amount_field: line["amount"],
+                        }))
+                # the total is only compared once every invoice amount is valid
+                all_valid = len(allocations) == len(row["invoices"])
+                if row.get("amount") is not None and all_valid and positive(row["amount"]) and float_compare(
+                    row["amount"], total, precision_rounding=rounding,
+                ) != 0:
+                    problems.append(_("The amount must equal the total of the invoices."))
+                vals.update({
+                    self._voucher_loaded_field: True,
+                    "allocation_line_ids": allocations,
+                })
+            elif positive(row.get("amount")):
+                vals["amount_manual"] = row["amount"]
+
+        elif row.get("account"):
+            vals.update({
+                self._voucher_party_type_field: "account",
+                "account_id": account_id(row["account"]),
+            })
+            if positive(row.get("amount")):
+                vals["amount_manual"] = row["amount"]
+
+        else:
+            problems.append(_("A row needs an account, a partner or lines."))
+
+        return vals, problems
+
+    def _create_import_batch(self, batch, results):
+        """Create the (row index, values) of ``batch`` in one call, or one by
+        one when the batch fails, and fill ``results`` in."""
+        try:
+            with self.env.cr.savepoint():
+                vouchers = self.create([vals for _index, vals in batch])
+        except Exception:
+            for index, vals in batch:
+                key = vals["import_key"]
+                try:
+                    with mute_logger("odoo.sql_db"), self.env.cr.savepoint():
+                        voucher = self.create(vals)
+                except errors.UniqueViolation:
+                    results[index] = {"key": key, "error": _("A voucher was already imported with this key.")}
+                except Exception as e:
+                    results[index] = {"key": key, "error": self._get_bulk_error(key, e)}
+                else:
+                    results[index] = {"key": key, "id": voucher.id}
+        else:
+            for (index, vals), voucher in zip(batch, vouchers):
+                results[index] = {"key": vals["import_key"], "id": voucher.id}
+
+    # =================================================
+    # POSTING CHECKS
+    # =================================================
+    def validate_for_posting(self):
+        """Check every document of ``self`` in one pass.
+
+        Returns {record id: [problem, ...]} for the documents that cannot be
+        posted (empty when all of them can).
+        """
+        problems = {}
+        for rec, message in self._get_posting_problems():
+            problems.setdefault(rec.id, []).append(message)
+        return problems
+
+    def _check_postable(self):
+        """Raise if a document of ``self`` cannot be posted, with every
+        problem found."""
+        problems = self._get_posting_problems()
+        if not problems:
+            return
+        if len(self) == 1:
+            raise UserError("\n".join(message for _rec, message in problems))
+        raise UserError("\n".join(
+            f"{rec.display_name}: {message}" for rec, message in problems
+        ))
+
+    def _read_states(self):
+        """Return the set of states of ``self``, read with one grouped
+        query."""
+        if not self:
+            return set()
+        return {state for [state] in self._read_group([("id", "in", self.ids)], ["state"])}
+
+    @api.model
+    def _read_multi_account_stats(self, model, parent_field, vouchers):
+        """Return {voucher id: (lines, lines with an account, lines with an
+        amount, lowest amount)} of the multi account lines of ``vouchers``."""
+        if not vouchers:
+            return {}
+        return {
+            voucher.id: (count, account_count, amount_count, amount_min)
+            for voucher, count, account_count, amount_count, amount_min
+            in self.env[model]._read_group(
+                [(parent_field, "in", vouchers.ids)],
+                [parent_field],
+                ["__count", "account_id:count", "amount:count", "amount:min"],
+            )
+        }
+
+    @api.model
+    def _read_allocated_totals(self, model, parent_field, amount_field, vouchers):
+        """Return {voucher id: total} of the selected allocations of
+        ``vouchers`` with a positive ``amount_field``."""
+        if not vouchers:
+            return {}
+        return {
+            voucher.id: total
+            for voucher, total in self.env[model]._read_group(
+                [(parent_field, "in", vouchers.ids), ("selected", "=", True), (amount_field, ">", 0)],
+                [parent_field],
+                [f"{amount_field}:sum"],
+            )
+        }
+
+    # =================================================
+    # JOURNAL ENTRY
+    # =================================================
+    def _get_posting_problems(self):
+        """Return the list of (record, message) of every problem preventing
+        a document of ``self`` from being posted."""
+        lines_field = self._fields["multi_account_line_ids"]
+        allocations_field = self._fields["allocation_line_ids"]
+        loaded = self._voucher_loaded_field
+        line_stats = self._read_multi_account_stats(
+            lines_field.comodel_name, lines_field.inverse_name, self.filtered("multi_account"),
+        )
+        allocated = self._read_allocated_totals(
+            allocations_field.comodel_name, allocations_field.inverse_name,
+            self._voucher_allocation_amount_field,
+            self.filtered(lambda r: not r.multi_account and r[loaded]),
+        )
+        date_label = self._fields[self._voucher_date_field]._description_string(self.env)
+
+        problems = []
+        for rec in self:
+            if rec.state != "approved":
+                problems.append((rec, _("Only approved records can be posted.")))
+            if not rec[self._voucher_date_field]:
+                problems.append((rec, _("Please set the %s before posting.", date_label)))
+            if not rec.journal_id.default_account_id:
+                problems.append((rec, _("Journal has no default account.")))
+
+            if rec.multi_account:
+                if rec[loaded]:
+                    problems.append((rec, _("Multi Account cannot be used with an invoice allocation.")))
+
+                count, account_count, amount_count, amount_min = line_stats.get(rec.id, (0, 0, 0, None))
+                if not count:
+                    problems.append((rec, _("Please add Multi Account lines first.")))
+                    continue
+                if account_count < count:
+                    problems.append((rec, _("Each Multi Account line must have an Account.")))
+                if amount_count < count or amount_min <= 0:
+                    problems.append((rec, _("Each Multi Account line Amount must be greater than zero.")))
+                continue
+
+            if not rec._get_counterpart_account():
+                problems.append((rec, _("Missing counterpart account.")))
+
+            if rec[loaded]:
+                if rec.id not in allocated:
+                    problems.append((rec, _("Please select invoices and enter amounts.")))
+                elif float_compare(
+                    allocated[rec.id],
+                    rec.amount or 0.0,
+                    precision_rounding=rec.currency_id.rounding,
+                ) != 0:
+                    problems.append((rec, _("Allocated total must equal the %s amount.", rec._description)))
+        return problems
+
+    def _get_counterpart_account(self):
+        """Account of the counterpart line(s) of a voucher that is not multi
+        account: the partner account of partner vouchers."""
+        self.ensure_one()
+        if self[self._voucher_party_type_field] == "partner":
+            return self.partner_id[self._voucher_partner_account_field]
+        return self.account_id
+
+    def _prepare_move_vals(self, name, rates, pay_lines=None):
+        """Values of the journal entry of ``self`` numbered ``name``,
+        converting amounts with ``_get_batch_rate(rates, ...)``.
+
+        One counterpart line per multi account line, per posted allocation,
+        or for the whole amount, then the cash line of the journal balancing
+        them in company currency. The (allocation, line index) pairs are
+        recorded in ``pay_lines`` under the record id, for the
+        reconciliation.
+        """
+        self.ensure_one()
+        sign = self._voucher_counterpart_sign
+        journal_currency = self.journal_id.currency_id or self.company_id.currency_id
+        company_currency = self.company_id.currency_id
+        # one rate per voucher, looked up once per batch
+        rate = self._get_batch_rate(
+            rates, journal_currency, company_currency, self.company_id, self[self._voucher_date_field],
+        )
+
+        def line_vals(account, partner, signed_amount):
+            balance = company_currency.round(signed_amount * rate)
+            vals = {
+                "account_id": account.id,
+                "partner_id": partner.id,
+                "debit": balance if balance > 0 else 0.0,
+                "credit": -balance if balance < 0 else 0.0,
+                "name": name,
+            }
+            if journal_currency != company_currency:
+                vals.update(currency_id=journal_currency.id, amount_currency=signed_amount)
+            return vals
+
+        no_partner = self.env["res.partner"]
+        if self.multi_account:
+            counterparts = [
+                (line.account_id, no_partner, line.amount)
+                for line in self.multi_account_line_ids
+            ]
+        elif self[self._voucher_loaded_field]:
+            account = self._get_counterpart_account()
+            allocations = self._get_posted_allocations()
+            counterparts = [
+                (account, self.partner_id, allocation[self._voucher_allocation_amount_field])
+                for allocation in allocations
+            ]
+            if pay_lines is not None:
+                pay_lines[self.id] = [(allocation, index) for index, allocation in enumerate(allocations)]
+        else:
+            partner = self.partner_id if self[self._voucher_party_type_field] == "partner" else no_partner
+            counterparts = [(self._get_counterpart_account(), partner, self.amount)]
+
+        lines = [
+            line_vals(account, partner, sign * amount)
+            for account, partner, amount in counterparts
+        ]
+        # the cash line balances the converted (rounded) counterpart lines
+        cash_line = line_vals(
+            self.journal_id.default_account_id, no_partner,
+            -sign * sum(amount for _account, _partner, amount in counterparts),
+        )
+        counter_balance = company_currency.round(sum(vals["debit"] - vals["credit"] for vals in lines))
+        cash_line.update(
+            debit=-counter_balance if counter_balance < 0 else 0.0,
+            credit=counter_balance if counter_balance > 0 else 0.0,
+        )
+        lines.append(cash_line)
+
+        return {
+            "move_type": "entry",
+            "journal_id": self.journal_id.id,
+            "date": self[self._voucher_date_field],
+            "ref": name,
+            "line_ids": [(0, 0, vals) for vals in lines],
+        }
+
+    def _get_posted_allocations(self):
+        """Allocation lines of ``self`` paid by its journal entry, in the
+        order of their counterpart lines."""
+        self.ensure_one()
+        if not self[self._voucher_loaded_field] or self.multi_account:
+            return self.allocation_line_ids.browse()
+        amount_field = self._voucher_allocation_amount_field
+        return self.allocation_line_ids.filtered(lambda l: l.selected and l[amount_field] > 0)
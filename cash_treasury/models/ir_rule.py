@@ -0,0 +1,11 @@
+from odoo import models
+
+
+class IrRule(models.Model):
+    _inherit = "ir.rule"
+
+    def _compute_domain_context_values(self):
+        yield from super()._compute_domain_context_values()
+        # the treasury rules depend on the journals of the user: cache their
+        # domains per access version instead of clearing every cache
+        yield self.env.user.cash_treasury_access_version
@@ -1,4 +1,4 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 
 class ResUsers(models.Model):
     _inherit = "res.users"
@@ -11,25 +11,52 @@ class ResUsers(models.Model):
         string="Cash Treasury Journals",
         domain="[('type','in',('cash','bank'))]"
     )
+    # bumped whenever the treasury journals of the user change
+    cash_treasury_access_version = fields.Integer(default=0, readonly=True, copy=False)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        users = super().create(vals_list)
+        if any('cash_treasury_journal_ids' in vals for vals in vals_list):
+            users.sudo().cash_treasury_journal_ids._cash_treasury_provision_sequences()
+        return users
 
     def write(self, vals):
         res = super().write(vals)
         if 'cash_treasury_journal_ids' in vals:
-           
-            try:
-                self.env['ir.rule'].clear_caches()
-                self.env.registry.clear_cache()
-                
-              
-                if hasattr(self.env['account.journal'], '_cache'):
-                    self.env['account.journal']._cache.clear()
-                
-              
-                if 'cash.treasury.in' in self.env:
-                    self.env['cash.treasury.in'].clear_caches()
-                if 'cash.treasury.out' in self.env:
-                    self.env['cash.treasury.out'].clear_caches()
-                    
-            except Exception:
-                pass
-        return res
\ No newline at end of file
+            # number vouchers of newly assigned journals without a lazy
+            # (and racy) sequence creation at their first posting
+            self.sudo().cash_treasury_journal_ids._cash_treasury_provision_sequences()
+            self._cash_treasury_invalidate_access()
+        return res
+
+    @tools.ormcache('self.id', 'self.cash_treasury_access_version', 'tuple(sorted(company_ids))')
+    def _cash_treasury_allowed_ids(self, company_ids):
+        """Return (journal ids, cash account ids) of the treasury journals of
+        the user in ``company_ids``, as tuples.
+
+        Used by the record rules, journal domains and defaults of the
+        vouchers instead of reading the journals of the user each time.
+        """
+        self.ensure_one()
+        journals = self.sudo().cash_treasury_journal_ids.filtered(
+            lambda j: j.company_id.id in company_ids
+        )
+        return tuple(journals.ids), tuple(journals.default_account_id.ids)
+
+    def _cash_treasury_invalidate_access(self):
+        """Make the cached record rules and allowed ids of ``self`` stale
+        after a change of their treasury journals.
+
+        The version is part of both cache keys (see ir.rule), so the users
+        get new entries in every worker while the caches of the other users,
+        views and models are kept.
+        """
+        if not self:
+            return
+        self.env.cr.execute("""
+            UPDATE res_users
+            SET cash_treasury_access_version = cash_treasury_access_version + 1
+            WHERE id IN %s
+        """, [tuple(self.ids)])
+        self.invalidate_recordset(['cash_treasury_access_version'])
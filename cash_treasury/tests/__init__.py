@@ -0,0 +1,2 @@
+from . import test_access_cache
+from . import test_report_plan
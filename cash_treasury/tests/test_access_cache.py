@@ -0,0 +1,54 @@
+from odoo.tests import TransactionCase, new_test_user, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestAccessCache(TransactionCase):
+    """Changing the treasury journals of a user only makes the cached rule
+    domains of that user stale (see res.users._cash_treasury_invalidate_access)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.journal_a, cls.journal_b = cls.env['account.journal'].create([
+            {
+                'name': f"Treasury Cash {code}",
+                'code': code,
+                'type': 'cash',
+                'default_account_id': cls.env['account.account'].create({
+                    'name': f"Treasury Cash {code}",
+                    'code': f"5710{index}",
+                    'account_type': 'asset_cash',
+                }).id,
+            }
+            for index, code in enumerate(('TCA', 'TCB'))
+        ])
+        cls.user = new_test_user(cls.env, login='treasury_edited', groups='base.group_user')
+        cls.other_user = new_test_user(cls.env, login='treasury_other', groups='base.group_user')
+        (cls.user | cls.other_user).cash_treasury_journal_ids = cls.journal_a
+
+    def _rule_account_ids(self, user):
+        domain = self.env['ir.rule'].with_user(user)._compute_domain('cash.treasury.report.line', 'read')
+        return {
+            account_id
+            for leaf in domain
+            if isinstance(leaf, (list, tuple)) and leaf[0] == 'account_id'
+            for account_id in leaf[2]
+        }
+
+    def test_journal_change_keeps_unrelated_caches(self):
+        account_a = self.journal_a.default_account_id
+        account_b = self.journal_b.default_account_id
+
+        # prime an unrelated ormcache entry and the rule domains of both users
+        self.env['ir.model']._get_id('res.partner')
+        self.assertEqual(self._rule_account_ids(self.other_user), {account_a.id})
+        self.assertEqual(self._rule_account_ids(self.user), {account_a.id})
+
+        self.user.cash_treasury_journal_ids = self.journal_b
+
+        # cache hits: answered without any query
+        with self.assertQueryCount(0):
+            self.env['ir.model']._get_id('res.partner')
+            self.assertEqual(self._rule_account_ids(self.other_user), {account_a.id})
+
+        self.assertEqual(self._rule_account_ids(self.user), {account_b.id})
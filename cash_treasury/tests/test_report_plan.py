@@ -0,0 +1,50 @@
+from odoo.tests import TransactionCase, tagged
+from odoo.tools import SQL
+
+LEDGER_INDEX = 'cash_treasury_aml_posted_account_date_idx'
+
+
+@tagged('post_install', '-at_install')
+class TestReportPlan(TransactionCase):
+    """The running-balance window of one account reads the ledger in the
+    order of the partial index created by cash.treasury.report.line.init()
+    instead of sorting it."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.account = cls.env['account.account'].create({
+            'name': "Treasury Plan Cash",
+            'code': '571090',
+            'account_type': 'asset_cash',
+        })
+        cls.Report = cls.env['cash.treasury.report.line']
+
+    def _explain(self, query):
+        # the test ledger is too small for an index to be worth it
+        self.env.cr.execute("SET LOCAL enable_seqscan = off")
+        self.env.cr.execute(SQL("EXPLAIN (FORMAT JSON) %s", query))
+        return self.env.cr.fetchone()[0][0]['Plan']
+
+    def _nodes(self, plan):
+        yield plan
+        for child in plan.get('Plans', []):
+            yield from self._nodes(child)
+
+    def assertWindowOnIndex(self, plan):
+        nodes = list(self._nodes(plan))
+        self.assertIn(LEDGER_INDEX, [node.get('Index Name') for node in nodes])
+        windows = [node for node in nodes if node['Node Type'] == 'WindowAgg']
+        self.assertTrue(windows)
+        for window in windows:
+            self.assertNotIn('Sort', [node['Node Type'] for node in self._nodes(window)])
+
+    def test_rebuild_plan(self):
+        self.assertWindowOnIndex(self._explain(self.Report._get_rebuild_query([self.account.id])))
+
+    def test_period_plan(self):
+        Report = self.Report.with_context(
+            cash_treasury_date_to='2024-12-31',
+            cash_treasury_account_ids=[self.account.id],
+        )
+        self.assertWindowOnIndex(self._explain(Report._table_query))
@@ -0,0 +1,3 @@
+from . import cash_report_wizard
+from . import cash_analysis_export_wizard
+from . import cash_treasury_bulk_result
@@ -0,0 +1,206 @@
+import csv
+import os
+import tempfile
+from datetime import timedelta
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError, ValidationError
+from odoo.tools import SQL
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+# rows fetched per round trip from the server-side cursor
+EXPORT_CHUNK_SIZE = 2000
+# rows of an XLSX worksheet, header included
+XLSX_MAX_ROWS = 1048576
+# hours an export file stays available for download
+EXPORT_RETENTION_HOURS = 24
+
+EXPORT_FIELDS = [
+    "date",
+    "move_id",
+    "journal_id",
+    "account_id",
+    "partner_id",
+    "label",
+    "counter_account_id",
+    "counter_partner_id",
+    "counter_label",
+    "debit",
+    "credit",
+    "balance",
+]
+
+
+class CashAnalysisExportWizard(models.TransientModel):
+    """Export the transaction analysis without loading it in the ORM.
+
+    Rows are streamed from a named (server-side) cursor in chunks, many2one
+    names are resolved once per chunk, and the file is written incrementally
+    to a temporary file, so building the file does not load the period in
+    memory. The finished file becomes a temporary download attachment,
+    deleted after EXPORT_RETENTION_HOURS.
+    """
+    _name = "cash.analysis.export.wizard"
+    _description = "Cash Transaction Analysis Export"
+
+    account_ids = fields.Many2many(
+        "account.account",
+        string="Accounts",
+        domain="[('account_type', 'in', ('asset_cash', 'asset_bank'))]",
+        help="Leave empty to export every cash/bank account.",
+    )
+    date_from = fields.Date(string="From", required=True)
+    date_to = fields.Date(string="To", required=True, default=fields.Date.context_today)
+    file_format = fields.Selection([
+        ("csv", "CSV"),
+        ("xlsx", "Excel (XLSX)"),
+    ], string="Format", required=True, default="xlsx")
+
+    @api.constrains("date_from", "date_to")
+    def _check_dates(self):
+        for wizard in self:
+            if wizard.date_from > wizard.date_to:
+                raise ValidationError(_("The start date must be before the end date."))
+
+    def action_export(self):
+        self.ensure_one()
+        if self.file_format == "xlsx" and xlsxwriter is None:
+            raise UserError(_("The xlsxwriter library is required for Excel exports."))
+
+        Analysis = self.env["cash.transaction.analysis"].with_context(
+            cash_treasury_date_from=fields.Date.to_string(self.date_from),
+            cash_treasury_date_to=fields.Date.to_string(self.date_to),
+            cash_treasury_account_ids=self.account_ids.ids,
+        )
+        headers = [Analysis._fields[name].string for name in EXPORT_FIELDS]
+
+        fd, path = tempfile.mkstemp(prefix="cash_analysis_", suffix=f".{self.file_format}")
+        os.close(fd)
+        try:
+            if self.file_format == "csv":
+                with open(path, "w", newline="", encoding="utf-8") as stream:
+                    writer = csv.writer(stream)
+                    writer.writerow(headers)
+                    for rows in self._iter_export_rows(Analysis):
+                        writer.writerows(
+                            [
+                                "" if value is None else value
+                                for value in row
+                            ]
+                            for row in rows
+                        )
+            else:
+                workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+                bold = workbook.add_format({"bold": True})
+                date_format = workbook.add_format({"num_format": "yyyy-mm-dd"})
+                sheet, row_index = None, XLSX_MAX_ROWS
+                for rows in self._iter_export_rows(Analysis):
+                    for row in rows:
+                        # xlsxwriter silently drops rows past the sheet limit:
+                        # continue on a new sheet instead
+                        if row_index == XLSX_MAX_ROWS:
+                            sheet = workbook.add_worksheet(
+                                "%s %s" % (_("Analysis"), len(workbook.worksheets()) + 1)
+                                if workbook.worksheets() else _("Analysis")
+                            )
+                            sheet.write_row(0, 0, headers, bold)
+                            row_index = 1
+                        sheet.write_datetime(row_index, 0, row[0], date_format)
+                        sheet.write_row(row_index, 1, row[1:])
+                        row_index += 1
+                if sheet is None:
+                    workbook.add_worksheet(_("Analysis")).write_row(0, 0, headers, bold)
+                workbook.close()
+
+            attachment = self._create_export_attachment(path)
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
+        return {
+            "type": "ir.actions.act_url",
+            "url": f"/web/content/{attachment.id}?download=true",
+            "target": "self",
+        }
+
+    def _iter_export_rows(self, Analysis):
+        """Yield lists of export rows, one list per chunk of the cursor."""
+        # the period and accounts come from the context (period mode)
+        Analysis.env.flush_all()
+        query = Analysis._search([], order=Analysis._order)
+        sql = query.select(*(
+            SQL.identifier(query.table, name) for name in EXPORT_FIELDS
+        ))
+
+        many2ones = {
+            index: Analysis._fields[name].comodel_name
+            for index, name in enumerate(EXPORT_FIELDS)
+            if Analysis._fields[name].type == "many2one"
+        }
+        # server-side cursor: rows stay in PostgreSQL until fetched
+        cursor = self.env.cr._cnx.cursor(f"cash_analysis_export_{self.id}")
+        try:
+            cursor.execute(sql.code, sql.params)
+            while True:
+                chunk = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                names = self._resolve_names(chunk, many2ones)
+                yield [
+                    [
+                        names[index].get(value, "") if index in many2ones else value
+                        for index, value in enumerate(row)
+                    ]
+                    for row in chunk
+                ]
+        finally:
+            cursor.close()
+
+    def _resolve_names(self, chunk, many2ones):
+        """Return {column index: {id: display_name}} for the many2one columns
+        of ``chunk``, with one lookup per comodel."""
+        ids_by_model = {}
+        for index, model in many2ones.items():
+            ids_by_model.setdefault(model, set()).update(
+                row[index] for row in chunk if row[index]
+            )
+        names_by_model = {}
+        for model, ids in ids_by_model.items():
+            records = self.env[model].browse(ids)
+            names_by_model[model] = {record.id: record.display_name for record in records}
+            # keep the cache from growing with the exported period
+            records.invalidate_recordset()
+        return {index: names_by_model[model] for index, model in many2ones.items()}
+
+    def _create_export_attachment(self, path):
+        """Turn the file at ``path`` into an attachment of the wizard, kept
+        for EXPORT_RETENTION_HOURS (see _gc_export_attachments)."""
+        name = "cash_transaction_analysis_%s_%s.%s" % (
+            fields.Date.to_string(self.date_from),
+            fields.Date.to_string(self.date_to),
+            self.file_format,
+        )
+        mimetype = (
+            "text/csv" if self.file_format == "csv"
+            else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+        with open(path, "rb") as stream:
+            return self.env["ir.attachment"].create({
+                "name": name,
+                "mimetype": mimetype,
+                "res_model": self._name,
+                "res_id": self.id,
+                "raw": stream.read(),
+            })
+
+    @api.autovacuum
+    def _gc_export_attachments(self):
+        """Delete the export files older than EXPORT_RETENTION_HOURS."""
+        self.env["ir.attachment"].sudo().search([
+            ("res_model", "=", self._name),
+            ("create_date", "<", fields.Datetime.now() - timedelta(hours=EXPORT_RETENTION_HOURS)),
+        ]).unlink()
@@ -0,0 +1,38 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+
+
+class CashTreasuryReportWizard(models.TransientModel):
+    _name = "cash.treasury.report.wizard"
+    _description = "Treasury Report by Period"
+
+    account_ids = fields.Many2many(
+        "account.account",
+        string="Accounts",
+        domain="[('account_type', 'in', ('asset_cash', 'asset_bank'))]",
+        help="Leave empty to report on every cash/bank account.",
+    )
+    date_from = fields.Date(string="From", required=True)
+    date_to = fields.Date(string="To", required=True, default=fields.Date.context_today)
+
+    @api.constrains("date_from", "date_to")
+    def _check_dates(self):
+        for wizard in self:
+            if wizard.date_from > wizard.date_to:
+                raise ValidationError(_("The start date must be before the end date."))
+
+    def action_open_report(self):
+        self.ensure_one()
+        return {
+            "type": "ir.actions.act_window",
+            "name": _("Treasury Report %(date_from)s - %(date_to)s", date_from=self.date_from, date_to=self.date_to),
+            "res_model": "cash.treasury.report.line",
+            "view_mode": "list",
+            "search_view_id": self.env.ref("cash_treasury.view_cash_treasury_report_line_search").id,
+            "context": {
+                "group_by": "account_id",
+                "cash_treasury_date_from": fields.Date.to_string(self.date_from),
+                "cash_treasury_date_to": fields.Date.to_string(self.date_to),
+                "cash_treasury_account_ids": self.account_ids.ids,
+            },
+        }
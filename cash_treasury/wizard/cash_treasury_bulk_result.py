@@ -0,0 +1,38 @@
+from odoo import models, fields, api, _
+
+
+class CashTreasuryBulkResult(models.TransientModel):
+    """Outcome of a bulk approve / post: the documents left out and why."""
+    _name = "cash.treasury.bulk.result"
+    _description = "Cash Treasury Bulk Action Result"
+
+    operation = fields.Char(readonly=True)
+    res_model = fields.Char(readonly=True)
+    done_count = fields.Integer(string="Succeeded", readonly=True)
+    failed_count = fields.Integer(string="Failed", compute="_compute_failed_count")
+    line_ids = fields.One2many("cash.treasury.bulk.result.line", "result_id", string="Failures", readonly=True)
+
+    @api.depends("line_ids")
+    def _compute_failed_count(self):
+        for result in self:
+            result.failed_count = len(set(result.line_ids.mapped("res_id")))
+
+    def action_open_failed(self):
+        self.ensure_one()
+        return {
+            "type": "ir.actions.act_window",
+            "name": _("Failed Documents"),
+            "res_model": self.res_model,
+            "views": [(False, "list"), (False, "form")],
+            "domain": [("id", "in", self.line_ids.mapped("res_id"))],
+        }
+
+
+class CashTreasuryBulkResultLine(models.TransientModel):
+    _name = "cash.treasury.bulk.result.line"
+    _description = "Cash Treasury Bulk Action Failure"
+
+    result_id = fields.Many2one("cash.treasury.bulk.result", required=True, ondelete="cascade")
+    res_id = fields.Integer(string="Document ID", readonly=True)
+    document = fields.Char(readonly=True)
+    error = fields.Text(readonly=True)